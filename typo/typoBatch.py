@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+ (C)2023 Patrice Karatchentzeff
+
+ This program is free software; you can redistribute it and/or modify
+ it under the terms of the  GPL, v3 (GNU General Public License as published by
+ the Free Software Foundation, version 3 of the License), or any later version.
+ See the Scribus Copyright page in the Help Browser for further informaton
+ about GPL, v3.
+
+ SYNOPSIS
+
+ Batch of Scribus documents in a single Scribus session: each document of
+the queue is opened, corrected by typoImprimerieNationale.py (without any
+dialog, see its headless mode), saved and closed, then the next one, so
+Scribus starts only once. A single report gives the time of each step and
+the rule counts of each document.
+
+ REQUIREMENTS
+
+ You must run from Scribus (scribus -g -py for a batch without window).
+
+ USAGE
+
+    scribus -g -ns -py typoBatch.py [--workflow page|lint] [--language fr-FR]
+            [--queue FILE] [--report REPORT] [document.sla ...]
+
+ The queue is the documents given, then the lines of FILE ("-": standard
+input), one path by line. REPORT is .json (default) or .csv; without it, a
+JSON report is written on the standard output. The exit status is the
+worst one of the documents (see typoImprimerieNationale.py): 0 done, 1 lint
+changes to do, 2 bad document, 3 failure.
+
+ DEVELOPMENT
+
+Each document is run by main_wrapper() of typoImprimerieNationale.py, with
+the options of a headless run; the script keeps the compiled rule packs and
+the memo of the paragraphs from one document to the next. A document is
+only saved if the text of one of its stories has changed (never in the lint
+workflow).
+
+"""
+
+import sys
+
+try:
+    import scribus
+except ImportError:
+    print("This Python script is written for the Scribus scripting interface.")
+    print("It can only be run from within Scribus.")
+    sys.exit(1)
+
+import os
+import csv
+import json
+import time
+import argparse
+
+# the script is next to this one
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import typoEngine
+import typoImprimerieNationale as typo
+
+# variables definition
+#
+workflow = "page"     # page or lint: workflow of each document
+steps = ("open", "process", "save", "close") # timed steps of a document
+
+# Columns of the CSV report
+#
+report_fields = ("document", "status") + steps + ("stories", "cached", "changed") + typoEngine.indicators
+
+# Queue of the documents
+#    paths: documents of the command line
+#    queue: file of paths, one by line ("-": standard input)
+def read_queue(paths, queue=None):
+    documents = list(paths)
+    if queue:
+        f = sys.stdin if queue == "-" else open(queue, encoding="utf-8")
+        with f:
+            documents.extend(line.strip() for line in f if line.strip())
+    return documents
+
+# Run a document: open, correct, save, close
+#    options: argv of typoImprimerieNationale.main_wrapper()
+#    returns the result of the document: status, time of each step,
+#    stories, indicators and counters of the memo
+def run_document(path, options):
+    result = {"document": path, "status": 0}
+    result.update(dict.fromkeys(steps, 0.0))
+    start = time.perf_counter()
+    try:
+        scribus.openDoc(path)
+    except Exception as error:
+        typo.log.error("%s: %s", path, error)
+        result["status"] = 2
+        return result
+    result["open"] = time.perf_counter() - start
+    try:
+        start = time.perf_counter()
+        result["status"] = typo.main_wrapper(options)
+        result["process"] = time.perf_counter() - start
+        summary = typo.run_summary()
+        result["stories"] = summary["stories"]
+        result["cached"] = summary["cached"]
+        result["changed"] = summary["changed"]
+        result["indicators"] = summary["indicators"]
+        result["memo"] = summary["memo"]
+        # the indicators count the signs seen, not the changes
+        if workflow != "lint" and result["status"] == 0 and summary["changed"]:
+            start = time.perf_counter()
+            scribus.saveDoc()
+            result["save"] = time.perf_counter() - start
+    except Exception:
+        typo.log.exception("%s: failure", path)
+        result["status"] = 3
+    finally:
+        start = time.perf_counter()
+        scribus.closeDoc()
+        result["close"] = time.perf_counter() - start
+    return result
+
+# Run the queue
+#    returns the consolidated report: the results and their totals
+#    the memo is kept from one document to the next, but its counters are
+#    reset by each run: they are added here
+def run_queue(documents, options):
+    results = []
+    start = time.perf_counter()
+    for number, path in enumerate(documents, 1):
+        scribus.statusMessage("Document {number}/{total}: {path}".format(
+            number=number, total=len(documents), path=path))
+        results.append(run_document(path, options))
+    total = dict.fromkeys(typoEngine.indicators, 0)
+    memo = typoEngine.memo.stats()
+    memo.update(hits=0, misses=0, evictions=0)
+    for result in results:
+        for indicator, value in result.get("indicators", {}).items():
+            total[indicator] += value
+        for counter in ("hits", "misses", "evictions"):
+            memo[counter] += result.get("memo", {}).get(counter, 0)
+    return {"documents": results,
+            "seconds": time.perf_counter() - start,
+            "status": max([result["status"] for result in results] or [0]),
+            "indicators": total,
+            "memo": memo}
+
+# Write the consolidated report
+#    fmt: json (everything) or csv (a row by document)
+def write_report(report, f, fmt="json"):
+    if fmt == "csv":
+        writer = csv.DictWriter(f, fieldnames=report_fields, extrasaction="ignore")
+        writer.writeheader()
+        for result in report["documents"]:
+            row = dict(result)
+            row.update(result.get("indicators", {}))
+            writer.writerow(row)
+    else:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+
+def main(argv):
+    global workflow
+    parser = argparse.ArgumentParser(prog="typoBatch.py",
+                                     description="French typography of a queue of Scribus documents in one Scribus session")
+    parser.add_argument("documents", nargs="*", help="Scribus documents")
+    parser.add_argument("--queue", help="file of documents, one by line (-: standard input)")
+    parser.add_argument("--workflow", choices=("page", "lint"), default=workflow,
+                        help="workflow of each document (default: %(default)s)")
+    parser.add_argument("--language", default=typo.language,
+                        help="rule pack: " + ", ".join(typoEngine.rule_packs) + " (default: %(default)s)")
+    parser.add_argument("--report", help="consolidated report, .json or .csv (default: JSON on stdout)")
+    parser.add_argument("--log-level", default=typo.loglevel, help="DEBUG, INFO, WARNING or ERROR (default: %(default)s)")
+    parser.add_argument("--log-file", help="also write the log in this file")
+    args = parser.parse_args(argv[1:])
+    workflow = args.workflow
+    options = ["typoImprimerieNationale.py", "--workflow", workflow, "--language", args.language,
+               "--log-level", args.log_level]
+    if args.log_file:
+        options += ["--log-file", args.log_file]
+    report = run_queue(read_queue(args.documents, args.queue), options)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8", newline="") as f:
+            write_report(report, f, "csv" if args.report.endswith(".csv") else "json")
+    else:
+        write_report(report, sys.stdout)
+    return report["status"]
+
+if __name__ == '__main__':
+    try:
+        status = main(sys.argv)
+    except SystemExit as error: # bad options
+        status = error.code if isinstance(error.code, int) else 2
+    except Exception:
+        typo.log.exception("batch failed")
+        status = 3
+    # as the headless mode of typoImprimerieNationale.py: leave Scribus at once
+    # with the status, only when started from the command line (not from the
+    # Script menu of the GUI)
+    if len(sys.argv) > 1:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
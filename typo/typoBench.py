@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+ (C)2023 Patrice Karatchentzeff
+
+ This program is free software; you can redistribute it and/or modify
+ it under the terms of the  GPL, v3 (GNU General Public License as published by
+ the Free Software Foundation, version 3 of the License), or any later version.
+ See the Scribus Copyright page in the Help Browser for further informaton
+ about GPL, v3.
+
+ SYNOPSIS
+
+ Benchmark of the typography on generated French texts, dense in signs:
+
+   - loop, regex: the typoEngine backends alone (char by char loop and
+     single pass regex),
+   - char, bulk: the whole Scribus script (typoImprimerieNationale.py, page
+     workflow) in the historical char by char mode and in bulk mode, on
+     typoFakeScribus, an in-process stand-in for the scribus module which
+     counts the calls to the bridge and can simulate their latency and the
+     redraw of the canvas.
+
+For each text size and each path: the time, the throughput, the number of
+calls to the bridge and the peak memory. The results of all the paths are
+also compared: they must be the same.
+
+ REQUIREMENTS
+
+ Nothing but Python (no Scribus).
+
+ USAGE
+
+    python3 typoBench.py [--sizes 1K,64K,1M] [--paths loop,regex,char,bulk]
+                         [--story 64K] [--frames 1] [--latency 0]
+                         [--redraw 0] [--no-batch] [--rewrite 0]
+                         [--loop-max 1M] [--density 0.25] [--seed 0]
+                         [--no-memory] [--calls]
+    python3 typoBench.py --compare 20000 [--seed 0]
+
+ The sizes go up to 50M; the char by char paths (loop, char) are
+only run up to --loop-max. --latency is the simulated duration of a bridge
+call, in microseconds, --redraw the duration of a canvas update after a
+text call when the redraw is on (--no-batch: the script leaves it on). The peak memory is measured with tracemalloc, which
+slows down all the paths: --no-memory gives the real times.
+
+ With --compare N, the two backends are run on N short random texts
+instead: their texts must be the same (exit status 1 otherwise). Their
+indicators may differ (see typoEngine.typo_text_regex): the number of
+texts with other indicators is only printed, with the first one.
+
+"""
+
+import sys
+import os
+import random
+import argparse
+import time
+import tracemalloc
+import contextlib
+
+import typoEngine
+import typoFakeScribus
+
+# Words and signs used for the generated text
+#   the signs are written with good, bad or missing spaces around them
+#
+words = ("le", "la", "les", "un", "une", "des", "typographie", "espace", "insécable",
+         "Imprimerie", "nationale", "texte", "cadre", "page", "règle", "guillemet",
+         "ponctuation", "française", "document", "Scribus", "ligne", "mot")
+signs = (".", ",", ";", ":", "!", "?", "—", "«", "»", "(", ")", "[", "]")
+spaces = ("", " ", "  ", typoEngine.non_breaking_space, typoEngine.non_breaking_thin_space)
+
+# Generate a text of size characters
+#    density: probability of a sign (with its spaces) instead of a word
+#    the text is built by blocks, so 50M does not need a list of millions of parts
+#
+def corpus(size, seed=0, density=0.25):
+    rand = random.Random(seed)
+    blocks = []
+    length = 0
+    while length < size:
+        parts = []
+        for part in range(4096):
+            if rand.random() < density:
+                part = rand.choice(spaces) + rand.choice(signs) + rand.choice(spaces)
+            else:
+                part = " " + rand.choice(words)
+            if rand.random() < 0.01:
+                part += "\r"           # paragraph separator of Scribus
+            parts.append(part)
+        block = ''.join(parts)
+        blocks.append(block)
+        length += len(block)
+    return ''.join(blocks)[:size]
+
+# Read a size like 512, 64K or 2M
+#
+def parse_size(value):
+    units = {"K": 1024, "M": 1024 * 1024}
+    if value[-1].upper() in units:
+        return int(value[:-1]) * units[value[-1].upper()]
+    return int(value)
+
+# Paths of the benchmark
+#    char by char paths are only run on small texts
+#
+engine_paths = ("loop", "regex")
+script_paths = ("char", "bulk")
+char_paths = ("loop", "char")
+
+# Stories of the document: the text cut in pieces of storysize characters
+#    the start and the end of a story are rule boundaries, so all the paths
+#    work on the same stories
+def split_stories(contents, storysize):
+    return [contents[start:start + storysize] for start in range(0, len(contents), storysize)]
+
+# Run the backend on each story and returns the corrected text
+#
+def run_backend(name, texts):
+    typoEngine.reset_stats()
+    if name == "loop":
+        return ''.join(typoEngine.typo_text_loop(text) for text in texts)
+    return ''.join(typoEngine.typo_text_regex(text) for text in texts)
+
+# Equivalence of the backends
+#
+# Short random texts made of letters, signs and all the space characters,
+# so every case of every rule (and their neighbours) is met.
+#
+def random_text(rand, length):
+    chars = "ab" + ''.join(signs) + ''.join(typoEngine.spacelist) + "\r"
+    return ''.join(rand.choice(chars) for position in range(length))
+
+# Compare the loop and the regex backends on count random texts
+#    returns (texts with another corrected text, texts with other indicators, first of each)
+def compare_backends(count, seed=0):
+    rand = random.Random(seed)
+    textdiffs = []
+    statdiffs = []
+    for number in range(count):
+        contents = random_text(rand, rand.randint(0, 12))
+        loop = typoEngine.TypoState()
+        regex = typoEngine.TypoState()
+        corrected = typoEngine.typo_text_loop(contents, state=loop)
+        if corrected != typoEngine.typo_text_regex(contents, state=regex):
+            textdiffs.append(contents)
+        elif loop.stats() != regex.stats():
+            statdiffs.append(contents)
+    return textdiffs, statdiffs
+
+# Run the Scribus script on a fake document and returns the corrected text
+#    each story is made of frames linked frametexts; the whole document is
+#    processed (page workflow)
+#
+def run_script(name, texts, frames=1, batch=True, rewrite=0):
+    typoFakeScribus.install()
+    import typoImprimerieNationale as script
+    typoFakeScribus.new_document(texts, frames)
+    typoFakeScribus.answers.append("2")      # whole document
+    script.bulkmode = name == "bulk"
+    script.incremental = False
+    script.batchedit = batch
+    script.rewritelimit = rewrite
+    script.index = None
+    script.story_heads.clear()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull): # messages of the log
+        script.main_wrapper(["typoImprimerieNationale.py", "--rewrite", str(rewrite)])
+    heads = ["Text{number}".format(number=number) for number in range(1, len(texts) + 1)]
+    return ''.join(typoFakeScribus.stories[head] for head in heads)
+
+# Run a path and measure it
+#    returns (corrected text, seconds, bridge calls, redraws, peak memory in bytes or None)
+#
+def run_path(name, texts, frames, memory=True, batch=True, rewrite=0):
+    typoFakeScribus.calls.clear()
+    typoFakeScribus.redraws = 0
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if name in script_paths:
+        corrected = run_script(name, texts, frames, batch, rewrite)
+    else:
+        corrected = run_backend(name, texts)
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return corrected, seconds, sum(typoFakeScribus.calls.values()), typoFakeScribus.redraws, peak
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark of the typography, with or without the (fake) Scribus bridge")
+    parser.add_argument("--sizes", "--size", default="1K,64K,1M",
+                        help="sizes of the generated texts, up to 50M (default: %(default)s)")
+    parser.add_argument("--paths", "--backends", default="loop,regex,char,bulk",
+                        help="paths to run (default: %(default)s)")
+    parser.add_argument("--story", default="64K", help="size of a story of the fake document (default: %(default)s)")
+    parser.add_argument("--frames", type=int, default=1, help="linked frametexts by story (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="simulated latency of a bridge call, in µs (default: %(default)s)")
+    parser.add_argument("--redraw", type=float, default=0,
+                        help="simulated duration of a canvas update, in µs (default: %(default)s)")
+    parser.add_argument("--no-batch", dest="batch", action="store_false",
+                        help="keep the redraw on during the edits (no batch edit)")
+    parser.add_argument("--rewrite", type=int, default=0,
+                        help="bulk: rewrite at once a paragraph with more edits (default: %(default)s, never)")
+    parser.add_argument("--loop-max", default="1M",
+                        help="largest text for the char by char paths (default: %(default)s)")
+    parser.add_argument("--density", type=float, default=0.25,
+                        help="probability of a sign instead of a word (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: %(default)s)")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="do not measure the peak memory (tracemalloc slows down the run)")
+    parser.add_argument("--calls", action="store_true", help="print the bridge calls by function")
+    parser.add_argument("--compare", type=int, metavar="N",
+                        help="only compare the loop and regex backends on N random texts")
+    args = parser.parse_args(argv[1:])
+    if args.compare:
+        textdiffs, statdiffs = compare_backends(args.compare, args.seed)
+        print("{count} texts: {texts} other texts, {stats} other indicators".format(
+            count=args.compare, texts=len(textdiffs), stats=len(statdiffs)))
+        for contents in textdiffs[:1] + statdiffs[:1]:
+            loop = typoEngine.TypoState()
+            regex = typoEngine.TypoState()
+            print("  {contents!r}: loop {loop!r} {loopstats}, regex {regex!r} {regexstats}".format(
+                contents=contents,
+                loop=typoEngine.typo_text_loop(contents, state=loop), loopstats=loop.stats(),
+                regex=typoEngine.typo_text_regex(contents, state=regex), regexstats=regex.stats()))
+        return 1 if textdiffs else 0
+    typoFakeScribus.latency = args.latency / 1e6
+    typoFakeScribus.redrawlatency = args.redraw / 1e6
+    storysize = parse_size(args.story)
+    loopmax = parse_size(args.loop_max)
+    status = 0
+    print("{size:>10} {path:>6} {seconds:>10} {speed:>12} {calls:>10} {redraws:>8} {peak:>10}".format(
+        size="chars", path="path", seconds="seconds", speed="char/s", calls="calls",
+        redraws="redraws", peak="peak MiB"))
+    for size in args.sizes.split(","):
+        contents = corpus(parse_size(size), args.seed, args.density)
+        texts = split_stories(contents, storysize)
+        results = {}
+        for name in args.paths.split(","):
+            if name in char_paths and len(contents) > loopmax:
+                continue
+            corrected, seconds, calls, redraws, peak = run_path(name, texts, args.frames,
+                                                                args.memory, args.batch, args.rewrite)
+            results[name] = corrected
+            print("{size:>10} {name:>6} {seconds:10.3f} {speed:12.0f} {calls:10} {redraws:8} {peak:>10}".format(
+                size=len(contents), name=name, seconds=seconds, speed=len(contents) / max(seconds, 1e-9),
+                calls=calls, redraws=redraws, peak="-" if peak is None else "{:.1f}".format(peak / 1048576)))
+            if args.calls and calls:
+                for function, count in typoFakeScribus.calls.most_common():
+                    print("{function:>40} {count:10}".format(function=function, count=count))
+        if len(set(results.values())) > 1:
+            print("ERROR: the paths do not give the same text!")
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,1368 @@
+# -*- coding: utf-8 -*-
+"""
+ (C)2023 Patrice Karatchentzeff
+ 
+ This program is free software; you can redistribute it and/or modify
+ it under the terms of the  GPL, v3 (GNU General Public License as published by
+ the Free Software Foundation, version 3 of the License), or any later version.
+ See the Scribus Copyright page in the Help Browser for further informaton 
+ about GPL, v3.
+ 
+ SYNOPSIS
+
+ Typographic engine of typoImprimerieNationale.py: the French rules of the
+Imprimerie nationale (France) applied on a Python string.
+ 
+ REQUIREMENTS
+ 
+ Nothing but Python: this module never imports scribus, so it can be used
+headless (CI, batch jobs...). typoImprimerieNationale.py is the Scribus
+adapter of this engine.
+ 
+ USAGE
+ 
+ As a module:
+
+    import typoEngine
+    corrected, edits = typoEngine.typo_text("Bonjour ,le monde:")
+
+ edits is the list of (start, end, replacement) changes on the initial text
+(see edit_script).
+
+ As a script (text from files or from standard input):
+
+    python3 typoEngine.py [--edits] [--language fr-FR] [--memo N] [--stream [--window N]] [file ...]
+
+ With --stream, a text is read and corrected by windows of about N
+characters: the memory used does not depend on the text length (see
+typo_stream).
+
+ DEVELOPMENT
+
+All the code are commented if you need to adapt this script for your
+own usage, for instance to adapt for other language than French.
+ 
+"""
+
+import sys
+import bisect
+import re
+import argparse
+import hashlib
+import csv
+import json
+import time
+import marshal
+import threading
+from collections import OrderedDict
+
+# variables definition
+#    only the settings: the state of a run is in a TypoState
+#
+backend = "regex"     # regex (default) or loop: algorithm used by typo_text()
+coalesce_gap = 1      # max number of unchanged characters rewritten for merging two edits
+language = "fr-FR"    # rule pack used by correct_text() (see rule_packs)
+window = 65536        # size of the windows of the streaming mode (see typo_stream)
+profiling = False     # record the time and the characters of each rule (see profile_rule)
+bridgecalls = None    # profiling: function giving the number of calls to the Scribus API so far (see profile_call)
+
+# Space character definition
+#   s    (normal space)
+#   nbs  (non breaking space)
+#   nbts (non breaking thin space)
+#   ts   (thin space)
+#   n    (nothing, i.e all except space)
+non_breaking_space = u"\u00a0"      
+non_breaking_thin_space = u"\u202f"
+thin_space = u"\u2009"
+space = ' '
+spacelist = [space, thin_space, non_breaking_space, non_breaking_thin_space]
+
+# Other specific characters
+#
+lparent = u"\u0028"   # left parenthesis  (
+rparent = u"\u0029"   # right parenthesis )
+lsbracket = u"\u005b" # left square bracket  [
+rsbracket = u"\u005d" # right square bracket ]
+
+# State of a run of the engine
+#    the cursor, the characters around it and the indicators of a run:
+#    each thread (or each story of a service) uses its own TypoState, so
+#    two runs never share their counters. The functions without state use
+#    default_state (the Scribus script and the command line).
+class TypoState:
+    __slots__ = ("char",             # current character
+                 "nextchar",         # next character
+                 "prevchar",         # previous character
+                 "c",                # indice (cursor) (in normal case, c=char)
+                 "totalpagemove",    # number of cursor movements in a page after insert/remove characters/spaces
+                 "spaceindic",       # remove space character indicator
+                 "singleindic",      # change single sign character indicator
+                 "doubleindic",      # change double sign character indicator
+                 "double_thinindic", # change double_thin sign character indicator
+                 "dashindic",        # change dash sign character indicator
+                 "langleindic",      # change left angle sign character indicator
+                 "rangleindic",      # change right angle sign character indicator
+                 "lparentindic",     # change left parenthesis sign character indicator
+                 "rparentindic",     # change reight parenthesis sign character indicator
+                 "editedchars",      # characters inserted, removed or replaced by the char by char loop
+                 "profile")          # rule -> {"calls", "time", "scanned", "modified", "api"} (see profile_rule)
+
+    def __init__(self):
+        self.char = ''
+        self.nextchar = ''
+        self.prevchar = ''
+        self.c = 0
+        self.editedchars = 0
+        self.profile = {}
+        self.reset()
+
+    # Reset all the indicators (before a new run)
+    def reset(self):
+        self.spaceindic = 0
+        self.singleindic = 0
+        self.doubleindic = 0
+        self.double_thinindic = 0
+        self.dashindic = 0
+        self.langleindic = 0
+        self.rangleindic = 0
+        self.lparentindic = 0
+        self.rparentindic = 0
+        self.totalpagemove = 0
+
+    # Current values of all the indicators
+    def stats(self):
+        return {indicator: getattr(self, indicator) for indicator in indicators}
+
+default_state = TypoState()
+
+# The old module variables (typoEngine.singleindic...) are those of default_state
+#
+def __getattr__(name):
+    if name in TypoState.__slots__:
+        return getattr(default_state, name)
+    raise AttributeError("module {module!r} has no attribute {name!r}".format(module=__name__, name=name))
+
+# basic functions for manipulating/testing characters
+#
+
+# define char, prevchar and char
+#        cur: current position in buffer
+#     buffer: the text as a list of characters (or any object with the
+#             same interface, see ScribusText in typoImprimerieNationale.py)
+#      state: the TypoState of the run
+def define_char(cur, buffer, state):
+    textlen = len(buffer)
+    # Possible blank or almost-blank page!
+    if textlen <= 1:
+        state.prevchar = ''
+        state.char = ''
+        state.nextchar = ''
+    else:
+        state.prevchar = buffer[cur - 1] if cur > 0 else ''
+        state.nextchar = buffer[cur + 1] if cur < textlen - 1 else ''
+        state.char = buffer[cur]
+
+# Space character tests
+#
+def match_space(char):
+    if char in spacelist:
+        return True
+    else:
+        return False
+
+def not_match_space(char):
+    if char in spacelist:
+        return False
+    else:
+        return True
+
+# Inserting, deleting and replacing characters
+#  - run only for ONE character, no need more in French -
+#
+def insert_char(char, position, text, state):
+    text.insert(position, char)
+    state.c += 1 # current cursor has increased by 1
+    state.totalpagemove += 1
+    state.editedchars += 1
+
+def remove_char(position, text, state):
+    del text[position]
+    state.c -= 1 # current cursor has decreased by 1
+    state.totalpagemove -= 1
+    state.editedchars += 1
+
+def replace_char(char, position, text, state):
+    text[position] = char
+    state.editedchars += 1
+    
+# Official French typo by Imprimerie nationale française
+#
+# signs    before/after      associated test function   associated correction function
+# char   prevchar/nextchar
+#
+# ss...    s                 FR_is_a_space              FR_remove_duplicated_spaces
+# .,       n/s               FR_is_a_single             FR_typo_for_single
+# ;!?      nbts/s            FR_is_a_double_thin        FR_typo_for_double_thin
+# :        nbs/s             FR_is_a_double             FR_typo_for_double
+# —        s/s               FR_is_a_dash               FR_typo_for_dash
+# «        s/nbs             FR_is_a_langle             FR_typo_for_rangle
+# »        nbs/s             FR_is_a_rangle             FR_typo_for_langle
+# ([       s/n               FR_is_a_lparent            FR_typo_for_oparent
+# )]       n/s               FR_is_a_rparent            FR_typo_for_cparent
+#
+# NOTE1 : … is n/s at the end and then begining of a sentence
+#           is also n/n between bracket for indicating a cut
+#         --> automation is not possible, because depends of the context.
+# NOTE2 : french single and double quotes (guillemet APL ', guillemet dactyloographique ",
+#         apostrophe culbuté ‘, apostrophe ’, virgule double „, guillemet simple gauche ‹
+#         et guillemet simple droite ›) follows obvious rules (s/n for right and n/s for left).
+#         but are not fully automated because they depend of the context. People who use it
+#         know normaly what they do!
+#         !!! English quotes “ ” should not normaly use
+#
+# All the following process is based on the fact that there is not more than
+# ONE space to analyse, then it is important to remove first the following space
+# characters. In French typo, in any case, it is not possible to have many
+# following space characters
+# If ever you adapt the script for other languages, pay attention at this point
+
+# Clean following (duplicated) spaces
+#
+# all cases of space caracters
+def FR_is_a_space(char):
+    return (char == space) \
+        or (char == non_breaking_space) \
+        or (char == non_breaking_thin_space) \
+        or (char == thin_space)
+
+def FR_remove_duplicated_spaces(cur, text, prevchar, nextchar, state):
+    # remove current space after a space
+    # (because this function is included in a loop, the next step(s) will purchase/achieve the job)
+    if (match_space(prevchar)):
+        remove_char(cur, text, state)
+        state.spaceindic += 1
+
+# Now it is time to produce all the functions of the French typo rules
+#        
+# .,       n/s      FR_is_a_single    FR_typo_for_single
+#
+def FR_is_a_single(char):
+    return (char == '.') or (char == ',')
+
+def FR_typo_for_single(cur, text, prevchar, nextchar, state):
+    # n/n  --> n/s
+    if (not_match_space(prevchar) and not_match_space(nextchar)):  
+        insert_char(space, cur + 1, text, state)
+        state.singleindic += 1
+    # n/s  --> n/s (swap 'general' s in 'good' s if ever)  
+    if (not_match_space(prevchar) and match_space(nextchar)):  
+        replace_char(space, cur + 1, text, state)
+        state.singleindic += 1
+    # s/n  --> n/s 
+    if (match_space(prevchar) and not_match_space(nextchar)):  
+        remove_char(cur - 1, text, state)
+        insert_char(space, cur, text, state) # shif of -1 because of previous delete
+        state.singleindic += 1
+    # s/s  --> n/s (swap 'general' s in 'good' s if ever)  
+    if (match_space(prevchar) and match_space(nextchar)):  
+        remove_char(cur - 1, text, state)
+        replace_char(space, cur, text, state) # shif of -1 because of previous delete
+        state.singleindic += 1
+
+# ;!?      nbts/s         FR_is_a_double_thin       FR_typo_for_double_thin
+#
+def FR_is_a_double_thin(char):
+    return (char == ';') or (char == '!') or (char == '?')
+
+def FR_typo_for_double_thin(cur, text, prevchar, nextchar, state):
+    # s/s  --> nbts/s (swap if ever needs)
+    if (match_space(prevchar) and match_space(nextchar)):  
+        replace_char(non_breaking_thin_space, cur - 1, text, state)
+        replace_char(space, cur + 1, text, state)
+        state.double_thinindic += 1
+    # s/n  --> nbts/s 
+    if (match_space(prevchar) and not_match_space(nextchar)):  
+        replace_char(non_breaking_thin_space, cur - 1, text, state)
+        insert_char(space, cur + 1, text, state)
+        state.double_thinindic += 1
+    # n/n  --> nbts/s 
+    if (not_match_space(prevchar) and not_match_space(nextchar)):  
+        insert_char(non_breaking_thin_space, cur, text, state)
+        insert_char(space, cur + 2, text, state)
+        state.double_thinindic += 1
+    # n/s  --> nbts/s
+    if (not_match_space(prevchar) and match_space(nextchar)):  
+        insert_char(non_breaking_thin_space, cur, text, state)
+        replace_char(space, cur + 2, text, state)
+        state.double_thinindic += 1
+
+# :        nbs/s             FR_is_a_double             FR_typo_for_double
+#
+def FR_is_a_double(char):
+    return char == ':'
+
+def FR_typo_for_double(cur, text, prevchar, nextchar, state):
+    # s/s  --> nbs/s (swap if ever needs)
+    if (match_space(prevchar) and match_space(nextchar)):  
+        replace_char(non_breaking_space, cur - 1, text, state)
+        replace_char(space, cur + 1, text, state)
+        state.doubleindic += 1
+    # s/n  --> nbs/s 
+    if (match_space(prevchar) and not_match_space(nextchar)):  
+        replace_char(non_breaking_space, cur - 1, text, state)
+        insert_char(space, cur + 1, text, state)
+        state.doubleindic += 1
+    # n/n  --> nbs/s 
+    if (not_match_space(prevchar) and not_match_space(nextchar)):  
+        insert_char(non_breaking_space, cur, text, state)
+        insert_char(space, cur + 2, text, state)
+        state.doubleindic += 1
+    # n/s  --> nbs/s
+    if (not_match_space(prevchar) and match_space(nextchar)):  
+        insert_char(non_breaking_space, cur, text, state)
+        replace_char(space, cur + 2, text, state)
+        state.doubleindic += 1
+
+# —        s/s               FR_is_a_dash               FR_typo_for_dash
+#
+def FR_is_a_dash(char):
+    return char == '—'
+
+def FR_typo_for_dash(cur, text, prevchar, nextchar, state):
+    # s/s  --> s/s (swap if ever needs)
+    if (match_space(prevchar) and match_space(nextchar)):  
+        replace_char(space, cur - 1, text, state)
+        replace_char(space, cur + 1, text, state)
+        state.dashindic += 1
+    # s/n  --> s/s 
+    if (match_space(prevchar) and not_match_space(nextchar)):  
+        replace_char(space, cur - 1, text, state)
+        insert_char(space, cur + 1, text, state)
+        state.dashindic += 1
+    # n/n  --> s/s 
+    if (not_match_space(prevchar) and not_match_space(nextchar)):  
+        insert_char(space, cur, text, state)
+        insert_char(space, cur + 2, text, state)
+        state.dashindic += 1
+    # n/s  --> s/s
+    if (not_match_space(prevchar) and match_space(nextchar)):  
+        insert_char(space, cur, text, state)
+        replace_char(space, cur + 2, text, state)
+        state.dashindic += 1
+
+# «        s/nbs             FR_is_a_rangle             FR_typo_for_rangle
+#
+def FR_is_a_langle(char):
+    return char == '«'
+
+def FR_typo_for_langle(cur, text, prevchar, nextchar, state):
+    # s/s  --> s/nbs (swap if ever needs)
+    if (match_space(prevchar) and match_space(nextchar)):  
+        replace_char(space, cur - 1, text, state)
+        replace_char(non_breaking_space, cur + 1, text, state)
+        state.langleindic += 1
+    # s/n  --> s/nbs 
+    if (match_space(prevchar) and not_match_space(nextchar)):  
+        replace_char(space, cur - 1, text, state)
+        insert_char(non_breaking_space, cur + 1, text, state)
+        state.langleindic += 1
+    # n/n  --> s/nbs 
+    if (not_match_space(prevchar) and not_match_space(nextchar)):  
+        insert_char(space, cur, text, state)
+        insert_char(non_breaking_space, cur + 2, text, state)
+        state.langleindic += 1
+    # n/s  --> s/nbs
+    if (not_match_space(prevchar) and match_space(nextchar)):  
+        insert_char(space, cur, text, state)
+        replace_char(non_breaking_space, cur + 2, text, state)
+        state.langleindic += 1
+
+# »        nbs/s             FR_is_a_langle             FR_typo_for_langle
+#
+def FR_is_a_rangle(char):
+    return char == '»'
+
+def FR_typo_for_rangle(cur, text, prevchar, nextchar, state):
+    # s/s  --> nbs/s (swap if ever needs)
+    if (match_space(prevchar) and match_space(nextchar)):  
+        replace_char(non_breaking_space, cur - 1, text, state)
+        replace_char(space, cur + 1, text, state)
+        state.rangleindic += 1
+    # s/n  --> nbs/s 
+    if (match_space(prevchar) and not_match_space(nextchar)):  
+        replace_char(non_breaking_space, cur - 1, text, state)
+        insert_char(space, cur + 1, text, state)
+        state.rangleindic += 1
+    # n/n  --> nbs/s 
+    if (not_match_space(prevchar) and not_match_space(nextchar)):  
+        insert_char(non_breaking_space, cur, text, state)
+        insert_char(space, cur + 2, text, state)
+        state.rangleindic += 1
+    # n/s  --> nbs/s
+    if (not_match_space(prevchar) and match_space(nextchar)):  
+        insert_char(non_breaking_space, cur, text, state)
+        replace_char(space, cur + 2, text, state)
+        state.rangleindic += 1
+
+# ([       s/n               FR_is_a_lparent            FR_typo_for_lparent
+#
+def FR_is_a_lparent(char):
+    return (char == lparent) or (char == lsbracket)
+
+def FR_typo_for_lparent(cur, text, prevchar, nextchar, state):
+    # s/s  --> s/n 
+    if (match_space(prevchar) and match_space(nextchar)):  
+        replace_char(space, cur - 1, text, state)
+        remove_char(cur + 1, text, state)
+        state.lparentindic += 1
+    # s/n  --> s/n 
+    if (match_space(prevchar) and not_match_space(nextchar)):  
+        replace_char(space, cur - 1, text, state)
+        state.lparentindic += 1
+    # n/n  --> s/n 
+    if (not_match_space(prevchar) and not_match_space(nextchar)):  
+        insert_char(space, cur, text, state)
+        state.lparentindic += 1
+    # n/s  --> s/n
+    if (not_match_space(prevchar) and match_space(nextchar)):  
+        insert_char(space, cur, text, state)
+        remove_char(cur + 2, text, state)
+        state.lparentindic += 1
+
+# )]       n/s               FR_is_a_rparent            FR_typo_for_rparent
+#
+def FR_is_a_rparent(char):
+    return (char == ')') or (char == ']')
+
+def FR_typo_for_rparent(cur, text, prevchar, nextchar, state):
+    # s/s  --> n/s 
+    if (match_space(prevchar) and match_space(nextchar)):  
+        remove_char(cur - 1, text, state)
+        replace_char(space, cur, text, state)
+        state.rparentindic += 1
+    # s/n  --> n/s 
+    if (match_space(prevchar) and not_match_space(nextchar)):
+        remove_char(cur - 1, text, state)
+        insert_char(space, cur, text, state)
+        state.rparentindic += 1
+    # n/n  --> n/s 
+    if (not_match_space(prevchar) and not_match_space(nextchar)):  
+        insert_char(space, cur + 1, text, state)
+        state.rparentindic += 1
+    # n/s  --> n/s
+    if (not_match_space(prevchar) and match_space(nextchar)):  
+        replace_char(space, cur + 1, text, state)
+        state.rparentindic += 1
+
+# List of tuple functions for general purpose at the final loop
+# --> inconvenience: all the function should have the same arguments
+#
+FR_typo_todo = ((FR_is_a_space, FR_remove_duplicated_spaces), \
+                (FR_is_a_single, FR_typo_for_single), \
+                (FR_is_a_double_thin, FR_typo_for_double_thin), \
+                (FR_is_a_double, FR_typo_for_double), \
+                (FR_is_a_dash, FR_typo_for_dash), \
+                (FR_is_a_rangle, FR_typo_for_rangle), \
+                (FR_is_a_langle, FR_typo_for_langle), \
+                (FR_is_a_lparent, FR_typo_for_lparent), \
+                (FR_is_a_rparent, FR_typo_for_rparent) \
+                )
+
+# Reset all the indicators (before a new run)
+#
+def reset_stats(state=None):
+    (state or default_state).reset()
+
+# Current values of all the indicators
+#    returns a dictionary: indicator name -> value
+#
+indicators = ("spaceindic", "singleindic", "double_thinindic", "doubleindic", "dashindic",
+              "langleindic", "rangleindic", "lparentindic", "rparentindic")
+
+def stats(state=None):
+    return (state or default_state).stats()
+
+# Main loop: apply all the rules on the buffer, char by char
+#    buffer: list of characters, modified in place
+#    step: optional function called with (cursor, buffer) for each character
+#    state: the TypoState of the run (default: default_state)
+#
+def typo_buffer(buffer, todo=FR_typo_todo, step=None, state=None):
+    state = state or default_state
+    if profiling:
+        start = time.perf_counter()
+        ruletime = profile_time(state)
+        ruleapi = profile_api(state)
+        api = bridgecalls() if bridgecalls else 0
+        scanned = len(buffer)
+    state.c = 0 # init cursor at position 0
+    while state.c <= (len(buffer) - 1):
+        if step is not None:
+            step(state.c, buffer)
+        # setup prevchar, char and nextchar
+        define_char(state.c, buffer, state)
+        # adjust typo
+        for dotypo in todo:
+            if (dotypo[0](state.char)):
+                if profiling:
+                    profile_call(dotypo[1], state.c, buffer, state)
+                else:
+                    dotypo[1](state.c, buffer, state.prevchar, state.nextchar, state)
+        # next character
+        state.c += 1
+    if profiling:
+        # the loop itself: the time and the API calls out of the rules
+        ruletime = profile_time(state) - ruletime
+        ruleapi = profile_api(state) - ruleapi
+        api = (bridgecalls() - api if bridgecalls else 0) - ruleapi
+        profile_rule("scan", time.perf_counter() - start - ruletime, scanned, 0, state, api)
+    return buffer
+
+# Compute the changed spans between the initial and the corrected text
+#    returns a list of (start, end, replacement) on the initial text
+#  The rules only insert, remove or replace space characters: the non space
+#  characters are the same in both texts and are used as anchors, so only
+#  the space runs between two anchors have to be compared (linear time).
+def changed_spans(old, new):
+    spans = []
+    i = 0
+    j = 0
+    while True:
+        # space run in both texts
+        i2 = i
+        while i2 < len(old) and old[i2] in spacelist:
+            i2 += 1
+        j2 = j
+        while j2 < len(new) and new[j2] in spacelist:
+            j2 += 1
+        if old[i:i2] != new[j:j2]:
+            spans.append((i, i2, new[j:j2]))
+        if i2 >= len(old) or j2 >= len(new):
+            break
+        if old[i2] != new[j2]:
+            raise ValueError("corrected text does not match the initial text")
+        # next anchor
+        i = i2 + 1
+        j = j2 + 1
+    return spans
+
+# Single pass backend
+#
+# The char by char loop gives always the same result around a sign:
+#   * a run of spaces is reduced to its first space
+#   * the space before a sign becomes the "before" space of the sign
+#     (nothing for n), and the space after becomes its "after" space
+#   * between two signs, the space is the "before" space of the second one
+#     (the loop corrects it last)
+#   * the beginning and the end of the text are n
+#   * None (other rule packs only) keeps the space as it is (reduced to
+#     its first space), for instance after a period which may be in a number
+# So a whole text can be rewritten in one re.sub() pass: a cluster is a
+# sequence of signs with their spaces, a run is a sequence of spaces
+# between two other characters.
+#
+# signs   before                   after                    indicator
+FR_typo_spacing = ((".,",  '',                      space,              "singleindic"),
+                   (";!?", non_breaking_thin_space, space,              "double_thinindic"),
+                   (":",   non_breaking_space,      space,              "doubleindic"),
+                   ("—",   space,                   space,              "dashindic"),
+                   ("»",   non_breaking_space,      space,              "rangleindic"),
+                   ("«",   space,                   non_breaking_space, "langleindic"),
+                   ("([",  space,                   '',                 "lparentindic"),
+                   (")]",  '',                      space,              "rparentindic"))
+
+# Compile a spacing table into (regex, sign -> (before, after, indicator))
+#
+def compile_spacing(spacing):
+    signs = {}
+    for chars, before, after, indicator in spacing:
+        for sign in chars:
+            signs[sign] = (before, after, indicator)
+    spaces = "[" + re.escape(''.join(spacelist)) + "]"
+    signset = "[" + re.escape(''.join(signs)) + "]"
+    pattern = "(?P<cluster>{s}*{g}(?:{s}*{g})*{s}*)|(?P<run>{s}{{2,}})".format(s=spaces, g=signset)
+    return re.compile(pattern), signs
+
+FR_typo_compiled = compile_spacing(FR_typo_spacing)
+
+# Other rule packs (same format as FR_typo_spacing)
+#
+# French of Switzerland: no space before ; ! ?, thin spaces inside the guillemets
+# signs   before                   after                    indicator
+CH_typo_spacing = ((".,",  '',                      space,              "singleindic"),
+                   (";!?", '',                      space,              "double_thinindic"),
+                   (":",   non_breaking_space,      space,              "doubleindic"),
+                   ("—",   space,                   space,              "dashindic"),
+                   ("»",   non_breaking_thin_space, space,              "rangleindic"),
+                   ("«",   space,                   non_breaking_thin_space, "langleindic"),
+                   ("([",  space,                   '',                 "lparentindic"),
+                   (")]",  '',                      space,              "rparentindic"))
+
+# German: no space before the punctuation, spaced en dash (Gedankenstrich);
+# the guillemets are used both ways (»…« and «…»): not handled
+DE_typo_spacing = ((".,",  '',                      None,               "singleindic"),
+                   (";!?", '',                      None,               "double_thinindic"),
+                   (":",   '',                      None,               "doubleindic"),
+                   ("–",   space,                   space,              "dashindic"),
+                   ("([",  None,                    '',                 "lparentindic"),
+                   (")]",  '',                      None,               "rparentindic"))
+
+# English: no space before the punctuation, closed em dash, curly quotes
+EN_typo_spacing = ((".,",  '',                      None,               "singleindic"),
+                   (";!?", '',                      None,               "double_thinindic"),
+                   (":",   '',                      None,               "doubleindic"),
+                   ("—",   '',                      '',                 "dashindic"),
+                   ("“",   None,                    '',                 "langleindic"),
+                   ("”",   '',                      None,               "rangleindic"),
+                   ("([",  None,                    '',                 "lparentindic"),
+                   (")]",  '',                      None,               "rparentindic"))
+
+# Rule packs registry
+#
+# A rule pack is the spacing table of a language, given by a loader (a
+# function returning the table). A pack is loaded and compiled the first
+# time it is used, then kept in compiled_packs. The first pack of a
+# language is its default: "fr" or "fr_BE" give "fr-FR", "en_GB" gives "en".
+#
+rule_packs = {}       # language -> loader of the spacing table
+compiled_packs = {}   # language -> (spacing table, compiled table), filled on first use
+
+def register_pack(language, loader):
+    rule_packs[language] = loader
+    compiled_packs.pop(language, None)
+
+register_pack("fr-FR", lambda: FR_typo_spacing)  # Imprimerie nationale
+register_pack("fr-CH", lambda: CH_typo_spacing)
+register_pack("de", lambda: DE_typo_spacing)
+register_pack("en", lambda: EN_typo_spacing)
+compiled_packs["fr-FR"] = (FR_typo_spacing, FR_typo_compiled)  # already compiled
+
+# Registered pack of a language (Scribus or IETF code), None if none
+#
+def find_pack(name):
+    name = name.replace("_", "-").lower()
+    for pack in rule_packs:
+        if pack.lower() == name:
+            return pack
+    primary = name.split("-")[0]
+    for pack in rule_packs:
+        if pack.lower().split("-")[0] == primary:
+            return pack
+    return None
+
+# Spacing table and compiled table of a pack (default: the current language)
+#
+def load_pack(name=None):
+    pack = find_pack(name or language)
+    if pack is None:
+        raise KeyError("no rule pack for language " + repr(name or language))
+    if pack not in compiled_packs:
+        spacing = rule_packs[pack]()
+        compiled_packs[pack] = (spacing, compile_spacing(spacing))
+    return compiled_packs[pack]
+
+def pack_spacing(name=None):
+    return load_pack(name)[0]
+
+def pack_compiled(name=None):
+    return load_pack(name)[1]
+
+# Choose the rule pack of correct_text()
+#
+def set_language(name):
+    global language
+    pack = find_pack(name)
+    if pack is None:
+        raise ValueError("no rule pack for language " + repr(name))
+    language = pack
+
+# Version of the rules: changes as soon as a rule changes
+#    (used for the caches of the previous results)
+#
+def rules_version(spacing=None):
+    if spacing is None:
+        spacing = pack_spacing()
+    return hashlib.sha1(repr(spacing).encode("utf-8")).hexdigest()[:12]
+
+# Apply a compiled spacing table on a string in a single pass
+#    returns the corrected string
+#  The text is the one of the char by char loop (see typoBench.py --compare),
+#  the indicators may differ: each sign is counted once (the loop counts
+#  again a ( or [ when it removes the space after it), and spaceindic counts
+#  all the spaces removed (the loop only the duplicated ones).
+#
+def typo_text_regex(contents, compiled=None, state=None):
+    state = state or default_state
+    pattern, signs = compiled or pack_compiled()
+    counts = {}
+    removed = 0
+    # Possible blank or almost-blank page!
+    if len(contents) <= 1:
+        return contents
+    def rewrite(match):
+        nonlocal removed
+        group = match.group()
+        if match.lastgroup == "run":
+            removed += len(group) - 1
+            return group[0]
+        result = []
+        gap = ''
+        for char in group:
+            if char in signs:
+                before, after, indicator = signs[char]
+                removed += max(len(gap) - 1, 0)
+                counts[indicator] = counts.get(indicator, 0) + 1
+                result.append(gap[:1] if before is None else before)
+                result.append(char)
+                gap = ''
+            else:
+                gap += char
+        removed += max(len(gap) - 1, 0)
+        result.append(gap[:1] if after is None else after)
+        return ''.join(result)
+    if profiling:
+        start = time.perf_counter()
+        ruletime = profile_time(state)
+        corrected = pattern.sub(profile_rewrite(rewrite, signs, state), contents)
+        # the regex itself: the time out of the rules
+        ruletime = profile_time(state) - ruletime
+        profile_rule("scan", time.perf_counter() - start - ruletime, len(contents), 0, state)
+    else:
+        corrected = pattern.sub(rewrite, contents)
+    # update the indicators
+    state.spaceindic += removed
+    for indicator, count in counts.items():
+        setattr(state, indicator, getattr(state, indicator) + count)
+    return corrected
+
+# Apply the rules on a string with the char by char loop
+#    returns the corrected string
+#
+def typo_text_loop(contents, todo=FR_typo_todo, state=None):
+    return ''.join(typo_buffer(list(contents), todo, state=state))
+
+# Edit script
+#
+# Each edit (start, end, replacement) costs Scribus API calls when written
+# back into a frametext: selectText() + deleteText() if something is
+# removed, insertText() if something is inserted.
+#
+def edit_cost(edit):
+    start, end, replacement = edit
+    return (2 if end > start else 0) + (1 if replacement else 0)
+
+# Minimal list of edits from the initial text to the corrected text
+#    * the common part of the changed space runs is not rewritten
+#      (reducing "  " to " " is removing one space, not replacing two)
+#    * two edits separated by at most gap unchanged characters are merged
+#      (the characters in between are rewritten) when it costs less calls
+#    returns a list of (start, end, replacement) on the initial text,
+#    sorted from left to right: apply it from right to left, so the
+#    positions on the left are always valid
+def edit_script(old, new, gap=None):
+    if gap is None:
+        gap = coalesce_gap
+    edits = []
+    for start, end, replacement in changed_spans(old, new):
+        # trim the common prefix and suffix
+        removed = old[start:end]
+        while removed and replacement and removed[0] == replacement[0]:
+            removed = removed[1:]
+            replacement = replacement[1:]
+            start += 1
+        while removed and replacement and removed[-1] == replacement[-1]:
+            removed = removed[:-1]
+            replacement = replacement[:-1]
+            end -= 1
+        edit = (start, end, replacement)
+        # coalesce with the previous edit
+        if edits and start - edits[-1][1] <= gap:
+            previous = edits[-1]
+            merged = (previous[0], end, previous[2] + old[previous[1]:start] + replacement)
+            if edit_cost(merged) < edit_cost(previous) + edit_cost(edit):
+                edits[-1] = merged
+                continue
+        edits.append(edit)
+    return edits
+
+# Rewrite the busy paragraphs at once
+#    edits: the edit script of old (see edit_script)
+#    limit: the edits of a paragraph with more than limit edits become a
+#    single edit, from its first to its last change (0: never)
+#  Fewer API calls, but the unchanged characters in between are written
+#  again: in Scribus, they lose their own character style (an italic word
+#  takes the style of the text before it). Off by default.
+def rewrite_paragraphs(old, edits, limit):
+    if not limit or len(edits) <= limit:
+        return edits
+    ends = [position for position, char in enumerate(old) if char in paragraph_ends]
+    result = []
+    group = [] # edits of the current paragraph
+    for edit in edits + [None]:
+        if group and (edit is None or bisect.bisect_left(ends, edit[0]) != bisect.bisect_left(ends, group[0][0])):
+            if len(group) > limit:
+                parts = []
+                last = group[0][0]
+                for start, end, replacement in group:
+                    parts.append(old[last:start])
+                    parts.append(replacement)
+                    last = end
+                result.append((group[0][0], group[-1][1], ''.join(parts)))
+            else:
+                result.extend(group)
+            group = []
+        if edit is not None:
+            group.append(edit)
+    return result
+
+# Apply an edit script on a string (from right to left)
+#
+def apply_edits(contents, edits):
+    parts = []
+    last = len(contents)
+    for start, end, replacement in reversed(edits):
+        parts.append(contents[end:last])
+        parts.append(replacement)
+        last = start
+    parts.append(contents[:last])
+    return ''.join(reversed(parts))
+
+# Apply the rules on a string
+#    returns the corrected string and the edit script (see edit_script)
+#
+def typo_text(contents, state=None):
+    corrected = correct_text(contents, state=state)
+    return corrected, edit_script(contents, corrected)
+
+# Corrected string with the current backend
+#    name: language of the rule pack (default: the current language)
+#    state: the TypoState of the run (default: default_state)
+#    the char by char loop only knows the French rules (FR_typo_todo)
+#    the paragraphs already corrected are taken from the memo (see ParagraphMemo)
+def correct_text(contents, name=None, state=None):
+    pack = find_pack(name) if name else language
+    if memo.size and not profiling:
+        return memo.correct(contents, pack, state or default_state)
+    return correct_pack(contents, pack, state)
+
+# Corrected string with a rule pack, without the memo
+#
+def correct_pack(contents, pack, state=None):
+    if backend == "loop" and pack == "fr-FR":
+        return typo_text_loop(contents, state=state)
+    return typo_text_regex(contents, pack_compiled(pack), state)
+
+# Memo of the corrected paragraphs
+#
+# Catalogues repeat the same notices, captions and blurbs many times: a
+# paragraph already corrected is taken from the memo, with the indicators
+# of its correction, instead of being corrected again. A text is cut after
+# each paragraph separator followed by a character which is neither a space
+# nor a sign (the cut of the streaming mode: the result is the same). The
+# key is the paragraph, the version of the rule pack and the backend. Beyond
+# size paragraphs, the least recently used one is evicted; a paragraph of
+# more than limit characters is never kept (it is seldom found again, and
+# would evict many small ones).
+#
+paragraph_ends = "\r\n\u2029" # paragraph separators (Scribus, text files, Unicode)
+counted = indicators + ("totalpagemove", "editedchars") # counters of a correction
+
+class ParagraphMemo:
+    def __init__(self, size=0, limit=4096):
+        self.size = size           # max number of paragraphs (0: no memo)
+        self.limit = limit         # max length of a paragraph kept
+        self.paragraphs = OrderedDict() # (version, backend, paragraph) -> (corrected, counters)
+        self.cutters = {}          # version -> regex cutting the paragraphs
+        self.lock = threading.Lock() # the memo is shared by the threads
+        self.reset()
+
+    # Reset the counters
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Change the size (0: no memo) and the max length of a paragraph
+    def resize(self, size, limit=None):
+        with self.lock:
+            self.size = size
+            if limit is not None:
+                self.limit = limit
+            while len(self.paragraphs) > self.size:
+                self.paragraphs.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.paragraphs.clear()
+        self.reset()
+
+    def cutter(self, version, pack):
+        if version not in self.cutters:
+            signs = pack_compiled(pack)[1]
+            self.cutters[version] = re.compile("(?<=[{ends}])(?=[^{others}])".format(
+                ends=re.escape(paragraph_ends), others=re.escape(''.join(spacelist) + ''.join(signs))))
+        return self.cutters[version]
+
+    # Corrected text, paragraph by paragraph
+    #    the counters of each paragraph are added to state
+    def correct(self, contents, pack, state):
+        version = rules_version(pack_spacing(pack))
+        parts = []
+        for paragraph in self.cutter(version, pack).split(contents):
+            if len(paragraph) > self.limit:
+                parts.append(correct_pack(paragraph, pack, state))
+                continue
+            key = (version, backend, paragraph)
+            with self.lock:
+                found = self.paragraphs.get(key)
+                if found is not None:
+                    self.paragraphs.move_to_end(key)
+                    self.hits += 1
+            if found is None:
+                run = TypoState()
+                found = (correct_pack(paragraph, pack, run), tuple(getattr(run, name) for name in counted))
+                with self.lock:
+                    self.misses += 1
+                    self.paragraphs[key] = found
+                    if len(self.paragraphs) > self.size:
+                        self.paragraphs.popitem(last=False)
+                        self.evictions += 1
+            corrected, counters = found
+            for name, count in zip(counted, counters):
+                if count:
+                    setattr(state, name, getattr(state, name) + count)
+            parts.append(corrected)
+        return ''.join(parts)
+
+    # Counters of the memo
+    def stats(self):
+        return {"size": self.size, "paragraphs": len(self.paragraphs),
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+memo = ParagraphMemo()
+
+# Turn the memo on (size paragraphs) or off (0)
+#
+def set_memo(size, limit=None):
+    memo.resize(size, limit)
+
+# Texts in several languages
+#
+# A story may mix languages (the language of its characters in Scribus).
+# It is cut in segments of the same rule pack: each segment is corrected
+# with its pack, a segment without any pack is kept as it is (and not even
+# scanned). A rule must see the whole space runs of its sign and their
+# neighbours, so a segment is only cut between two characters which are
+# neither a space nor a sign (as the windows of the streaming mode): a cut
+# inside a run of spaces and signs is moved out of it, on the side of its
+# first sign, so the run is corrected with the pack of that sign.
+#
+
+# Segments of the same rule pack
+#    runs: list of (start, end, language) covering the text
+#    returns a list of (start, end, pack), pack is None for no pack
+def pack_segments(runs):
+    segments = []
+    for start, end, name in runs:
+        pack = find_pack(name) if name else None
+        if segments and segments[-1][2] == pack and segments[-1][1] == start:
+            segments[-1] = (segments[-1][0], end, pack)
+        else:
+            segments.append((start, end, pack))
+    return segments
+
+# Move the cut between two segments out of a run of spaces and signs
+#    others: the spaces and the signs of the packs
+#    returns the new cut
+def segment_cut(contents, cut, others):
+    def safe(position):
+        return position <= 0 or position >= len(contents) or \
+            (contents[position - 1] not in others and contents[position] not in others)
+    if safe(cut):
+        return cut
+    first = cut
+    while first > 0 and contents[first - 1] in others:
+        first -= 1
+    last = cut
+    while last < len(contents) and contents[last] in others:
+        last += 1
+    signs = [position for position in range(first, last) if contents[position] not in spacelist]
+    if not signs or signs[0] < cut:
+        # the run goes with the segment before the cut
+        while not safe(cut):
+            cut += 1
+    else:
+        while not safe(cut):
+            cut -= 1
+    return cut
+
+# Correct each segment with its rule pack
+#    returns the corrected text
+def correct_segments(contents, runs, state=None):
+    segments = pack_segments(runs)
+    others = set(spacelist)
+    for start, end, pack in segments:
+        if pack is not None:
+            others.update(pack_compiled(pack)[1])
+    parts = []
+    start = 0
+    for number, (first, end, pack) in enumerate(segments):
+        if number + 1 < len(segments):
+            end = max(segment_cut(contents, end, others), start)
+        else:
+            end = len(contents)
+        segment = contents[start:end]
+        parts.append(segment if pack is None else correct_text(segment, pack, state))
+        start = end
+    return ''.join(parts)
+
+# Range of a text
+#
+# Only a range of a long text is corrected (a selection, a paragraph...): the
+# text read is the range with a margin of context on each side. A sign
+# touched by the range (the sign or one of its spaces) is corrected with its
+# whole run of spaces and signs, even where it goes beyond the range, so its
+# spacing is never half fixed; the rest of the margins is only context. The
+# margins must hold the whole runs touched: each one needs a cut (see
+# stream_cut), otherwise a larger window is read (see range_context).
+#
+range_margin = 16     # characters of context read on each side of a range
+
+# Spaces and signs of a rule pack (the characters of the runs)
+#
+def run_chars(name=None):
+    pack = find_pack(name) if name else language
+    return set(spacelist) | set(pack_compiled(pack)[1])
+
+# Is the context of a range complete?
+#    window: the range with its margins
+#    start, end: the range in window
+#    head, tail: window starts at the start of the text, ends at its end
+def range_context(window, start, end, head=False, tail=False, name=None):
+    others = run_chars(name)
+    def cut(position):
+        return window[position - 1] not in others and window[position] not in others
+    return (head or any(cut(position) for position in range(1, start + 1))) and \
+        (tail or any(cut(position) for position in range(end, len(window))))
+
+# Edits of a range
+#    window: the range with its margins (see range_context)
+#    start, end: the range in window
+#    returns the edits of the runs of spaces and signs touched by the range
+#    (see edit_script), on window
+def range_edits(window, start, end, name=None, state=None):
+    corrected = correct_text(window, name, state)
+    others = run_chars(name)
+    edits = []
+    # no merging of the edits: only some of them are kept
+    for first, last, replacement in edit_script(window, corrected, 0):
+        # the run of the edit
+        left = first
+        while left > 0 and window[left - 1] in others:
+            left -= 1
+        right = last
+        while right < len(window) and window[right] in others:
+            right += 1
+        if left < end and max(right, first + 1) > start:
+            edits.append((first, last, replacement))
+    return edits
+
+# Streaming mode, for very large texts
+#
+# The text is read by chunks and corrected by windows of about window
+# characters, so the memory does not depend on the text length. The rules
+# only look at a sign and its space runs: a window is cut between two
+# characters which are neither a space nor a sign, so all the context of a
+# rule (prevchar, nextchar, the whole space run) is in the same window.
+# What follows the cut is kept for the next window (the overlap).
+#
+
+# Position of the last cut of a text (0 if none)
+#    between two characters which are neither a space nor a sign
+def stream_cut(text, compiled=None):
+    signs = (compiled or pack_compiled())[1]
+    for position in range(len(text) - 1, 0, -1):
+        if text[position] not in spacelist and text[position] not in signs \
+                and text[position - 1] not in spacelist and text[position - 1] not in signs:
+            return position
+    return 0
+
+# Windows of a text given by chunks
+#    chunks: iterable of strings (for instance blocks of a file)
+#    yields the windows, whose concatenation is the text
+#  Without any cut in the text read (only spaces and signs), the window
+#  grows until the next one.
+def stream_windows(chunks, size=None):
+    if size is None:
+        size = window
+    pending = []
+    length = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        length += len(chunk)
+        while length >= size:
+            text = ''.join(pending)
+            cut = stream_cut(text)
+            if cut == 0:
+                break
+            yield text[:cut]
+            pending = [text[cut:]]
+            length = len(pending[0])
+    text = ''.join(pending)
+    if text:
+        yield text
+
+# Correct a text given by chunks
+#    yields the corrected windows: ''.join(typo_stream(chunks)) is
+#    correct_text(''.join(chunks))
+def typo_stream(chunks, size=None, state=None):
+    for text in stream_windows(chunks, size):
+        yield correct_text(text, state=state)
+
+# Lint: violations of the rules, without changing anything
+#
+# Rule of a change: the sign next to the changed space run. Between two
+# signs, the space belongs to the second one (see FR_typo_spacing); far
+# from any sign, it is a duplicated space.
+#
+def rule_at(contents, start, end, compiled=None):
+    signs = (compiled or pack_compiled())[1]
+    position = sign_at(contents, start, end, signs)
+    if position is None:
+        return "space"
+    return signs[contents[position]][2][:-len("indic")]
+
+# Position of the sign of a change (None: a duplicated space)
+#
+def sign_at(contents, start, end, signs):
+    after = end
+    while after < len(contents) and contents[after] in spacelist:
+        after += 1
+    if after < len(contents) and contents[after] in signs:
+        return after
+    before = start - 1
+    while before >= 0 and contents[before] in spacelist:
+        before -= 1
+    if before >= 0 and contents[before] in signs:
+        return before
+    return None
+
+# List of the violations of a text
+#    corrected: the corrected text (see correct_text)
+#    context: number of characters shown before and after the change
+#    returns a list of {"offset", "rule", "before", "after"}
+#      before/after: the text around the change, before and after correction
+#  The changes of the same sign (the spaces before and after it) are a
+#  single violation: "after" is the corrected text, with all of them.
+def violations(contents, corrected, context=10, compiled=None):
+    signs = (compiled or pack_compiled())[1]
+    groups = [] # [sign position, rule, start, end, start in corrected, end in corrected]
+    shift = 0   # length of corrected - length of contents, before the current edit
+    for start, end, replacement in edit_script(contents, corrected, gap=0):
+        position = sign_at(contents, start, end, signs)
+        newend = end + shift + len(replacement) - (end - start)
+        if groups and position is not None and groups[-1][0] == position:
+            groups[-1][3] = end
+            groups[-1][5] = newend
+        else:
+            groups.append([position, rule_at(contents, start, end, compiled), start, end, start + shift, newend])
+        shift = newend - end
+    report = []
+    for position, rule, start, end, newstart, newend in groups:
+        report.append({"offset": start,
+                       "rule": rule,
+                       "before": contents[max(start - context, 0):end + context],
+                       "after": corrected[max(newstart - context, 0):newend + context]})
+    return report
+
+def lint_text(contents, context=10, state=None):
+    return violations(contents, correct_text(contents, state=state), context)
+
+# Write a lint report (json or csv)
+#    report: list of violations, with "document" and "frame" if known
+#
+report_fields = ("document", "frame", "offset", "rule", "before", "after")
+
+def write_report(report, f, fmt="json"):
+    if fmt == "csv":
+        writer = csv.DictWriter(f, fieldnames=report_fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(report)
+    else:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+
+# Profiling
+#
+# With profiling = True, each call of a rule is timed, with the number of
+# characters it was given (scanned: the sign and its neighbours for the
+# char by char loop, the matched sign and spaces for the regex) and the
+# number of characters it changed (modified). The pass over the text
+# itself is the "scan" rule. A rule is named by its indicator without
+# "indic" ("space" for the duplicated spaces), as in the lint report.
+# "calls" is the number of times a rule was applied; "api" the number of
+# calls to the Scribus API it made (char by char loop on a Scribus story,
+# counted by bridgecalls; always 0 for the regex, which works in memory).
+# The memo is not used while profiling (see correct_text): every paragraph
+# is corrected, so the times are the ones of a run without memo.
+#
+
+# Reset the profile (before a new text or a new run)
+#
+def reset_profile(state=None):
+    (state or default_state).profile = {}
+
+# Add a call to the profile of a rule
+#
+def profile_rule(rule, seconds, scanned, modified, state=None, api=0):
+    profile = (state or default_state).profile
+    entry = profile.get(rule)
+    if entry is None:
+        entry = profile[rule] = {"calls": 0, "time": 0.0, "scanned": 0, "modified": 0, "api": 0}
+    entry["calls"] += 1
+    entry["time"] += seconds
+    entry["scanned"] += scanned
+    entry["modified"] += modified
+    entry["api"] += api
+
+# Time spent in the rules (all but "scan")
+#
+def profile_time(state=None):
+    profile = (state or default_state).profile
+    return sum(entry["time"] for rule, entry in profile.items() if rule != "scan")
+
+# Calls to the Scribus API made by the rules (all but "scan")
+#
+def profile_api(state=None):
+    profile = (state or default_state).profile
+    return sum(entry["api"] for rule, entry in profile.items() if rule != "scan")
+
+# Name of a rule function of the char by char loop
+#    FR_typo_for_single -> single, FR_remove_duplicated_spaces -> space
+def rule_name(function):
+    name = function.__name__
+    if "_for_" in name:
+        return name.split("_for_", 1)[1]
+    return "space"
+
+# Call a rule of the char by char loop and profile it
+#
+def profile_call(function, cur, buffer, state):
+    edited = state.editedchars
+    api = bridgecalls() if bridgecalls else 0
+    start = time.perf_counter()
+    function(cur, buffer, state.prevchar, state.nextchar, state)
+    seconds = time.perf_counter() - start
+    profile_rule(rule_name(function), seconds, 3, state.editedchars - edited, state, # prevchar, char, nextchar
+                 bridgecalls() - api if bridgecalls else 0)
+
+# Number of characters changed between two texts
+#    a replaced, inserted or removed character counts for one
+def changed_chars(old, new):
+    return sum(max(end - start, len(replacement)) for start, end, replacement in changed_spans(old, new))
+
+# Rewrite function of typo_text_regex with profiling
+#
+def profile_rewrite(rewrite, signs, state):
+    def profiled(match):
+        start = time.perf_counter()
+        result = rewrite(match)
+        seconds = time.perf_counter() - start
+        group = match.group()
+        rule = "space"
+        if match.lastgroup != "run":
+            for char in group:
+                if char in signs:
+                    rule = signs[char][2][:-len("indic")]
+                    break
+        profile_rule(rule, seconds, len(group), changed_chars(group, result), state)
+        return result
+    return profiled
+
+# Export a profile
+#    frames: frame -> {"time", "api", "scanned", "modified", "rules": profile of the frame}
+#      api: number of calls to the Scribus API
+#    fmt: json, or pstats (the marshal format of cProfile, for pstats or snakeviz:
+#         each frame is a function calling its rules; f must be binary)
+#
+def write_profile(frames, f, fmt="json"):
+    rules = {}
+    for frame in frames.values():
+        for rule, entry in frame["rules"].items():
+            total = rules.setdefault(rule, {"calls": 0, "time": 0.0, "scanned": 0, "modified": 0, "api": 0})
+            for key in total:
+                total[key] += entry[key]
+    if fmt == "pstats":
+        stats = {}
+        for name, frame in frames.items():
+            ruletime = sum(entry["time"] for entry in frame["rules"].values())
+            caller = ("typo", 0, "frame " + name)
+            stats[caller] = (1, 1, max(frame["time"] - ruletime, 0.0), frame["time"], {})
+            for rule, entry in frame["rules"].items():
+                key = ("typo", 0, "rule " + rule)
+                cc, nc, tt, ct, callers = stats.get(key, (0, 0, 0.0, 0.0, {}))
+                callers[caller] = (entry["calls"], entry["calls"], entry["time"], entry["time"])
+                stats[key] = (cc + entry["calls"], nc + entry["calls"],
+                              tt + entry["time"], ct + entry["time"], callers)
+        marshal.dump(stats, f)
+    else:
+        json.dump({"rules": rules, "frames": frames,
+                   "memo": "not used while profiling: every paragraph is corrected"},
+                  f, ensure_ascii=False, indent=1)
+        f.write("\n")
+
+# Choose the algorithm of typo_text()
+#
+def set_backend(name):
+    global backend
+    backend = name
+
+# Headless usage: correct files (or standard input) to standard output
+#
+def main(argv):
+    parser = argparse.ArgumentParser(description="French typography of the Imprimerie nationale")
+    parser.add_argument("files", nargs="*", help="text files (default: standard input)")
+    parser.add_argument("--edits", action="store_true",
+                        help="print the list of changes instead of the corrected text")
+    parser.add_argument("--backend", choices=("regex", "loop"), default=backend,
+                        help="algorithm (default: %(default)s)")
+    parser.add_argument("--language", default=language,
+                        help="rule pack: " + ", ".join(rule_packs) + " (default: %(default)s)")
+    parser.add_argument("--memo", type=int, default=memo.size,
+                        help="paragraphs kept in the memo of the corrected paragraphs (default: %(default)s)")
+    parser.add_argument("--stream", action="store_true",
+                        help="read and correct the text by windows, in constant memory (very large texts)")
+    parser.add_argument("--window", type=int, default=window,
+                        help="size of the windows of --stream (default: %(default)s)")
+    args = parser.parse_args(argv[1:])
+    set_backend(args.backend)
+    set_memo(args.memo)
+    try:
+        set_language(args.language)
+    except ValueError as error:
+        parser.error(str(error))
+    sources = args.files or ["-"]
+    for source in sources:
+        f = sys.stdin if source == "-" else open(source, encoding="utf-8")
+        with f:
+            if args.stream:
+                windows = stream_windows(iter(lambda: f.read(args.window), ''), args.window)
+            else:
+                windows = [f.read()]
+            offset = 0 # position of the window in the text
+            for contents in windows:
+                if args.edits:
+                    corrected, edits = typo_text(contents)
+                    for start, end, replacement in edits:
+                        print("{source}:{start}:{end}:{old!r}->{new!r}".format(
+                            source=source, start=offset + start, end=offset + end,
+                            old=contents[start:end], new=replacement))
+                else:
+                    sys.stdout.write(correct_text(contents))
+                offset += len(contents)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+ (C)2023 Patrice Karatchentzeff
+
+ This program is free software; you can redistribute it and/or modify
+ it under the terms of the  GPL, v3 (GNU General Public License as published by
+ the Free Software Foundation, version 3 of the License), or any later version.
+ See the Scribus Copyright page in the Help Browser for further informaton
+ about GPL, v3.
+
+ SYNOPSIS
+
+ In-process stand-in for the scribus module of the Scribus scripter: the
+text, selection, page, dialog and progress calls used by
+typoImprimerieNationale.py, on an in-memory document. Each call is
+counted, and can be slowed down by a fixed latency to simulate the cost of
+the Scribus bridge, and of the redraw of the canvas after a text change.
+
+ REQUIREMENTS
+
+ Nothing but Python (no Scribus).
+
+ USAGE
+
+    import typoFakeScribus
+    typoFakeScribus.install()          # import scribus now gives this module
+    typoFakeScribus.new_document(["Il dit «bonjour» !"])
+    import typoImprimerieNationale
+
+ DEVELOPMENT
+
+ Only what the script needs is here, with the behaviour of Scribus 1.5:
+getAllText() returns the selected text if there is a selection, the linked
+frames share the same story, insertText() at -1 appends at the end of the
+story. The dialogs return the answers of the answers list, or their default.
+openDoc() opens a document of the files dictionary, saveDoc() writes it back.
+
+"""
+
+import sys
+import time
+from collections import Counter
+
+# variables definition
+#
+latency = 0.0         # simulated duration of each call to the bridge, in seconds
+redrawlatency = 0.0   # simulated duration of the canvas update after a text call, when the redraw is on
+calls = Counter()     # number of calls by function
+redraws = 0           # number of canvas updates
+stories = {}          # first frametext -> text of the story
+heads = {}            # frametext -> first frametext of its story
+previous = {}         # frametext -> previous linked frametext
+pages = []            # items of each page: [(name, type, order), ...]
+images = []           # image frames (not frametexts)
+page = 1              # current page
+selection = {}        # first frametext -> (start, count) of the text selection
+selected = []         # selected objects
+docname = ""          # file name of the document ("" if never saved)
+answers = []          # answers of the next valueDialog() calls (default: its default value)
+redraw = True         # setRedraw() state
+opened = False        # a document is open
+files = {}            # file name -> (texts, frames, perpage) of the documents of openDoc()
+
+# Constants of the scribus module
+#
+ICON_NONE = 0
+ICON_INFORMATION = 1
+ICON_WARNING = 2
+ICON_CRITICAL = 3
+BUTTON_NONE = 0
+BUTTON_OK = 1
+BUTTON_CANCEL = 4194304
+BUTTON_YES = 16384
+BUTTON_NO = 65536
+BUTTON_ABORT = 262144
+BUTTON_DEFAULT = 256
+
+# Functions updating the canvas when the redraw is on
+#
+redrawn = ("selectText", "insertText", "deleteText")
+
+# Busy wait: sleep() is too coarse for a few µs
+#
+def wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+# Every function of the bridge is counted and waits for the latency
+#
+def bridge(function):
+    name = function.__name__
+    def call(*args, **kwargs):
+        global redraws
+        calls[name] += 1
+        if latency:
+            wait(latency)
+        if redrawlatency and redraw and name in redrawn:
+            redraws += 1
+            wait(redrawlatency)
+        return function(*args, **kwargs)
+    call.__name__ = name
+    return call
+
+# Make this module the scribus module
+#
+def install():
+    sys.modules["scribus"] = sys.modules[__name__]
+
+# New document
+#    texts: text of each story
+#    frames: number of linked frametexts of each story
+#    perpage: number of frametexts by page
+#    pictures: number of image frames on each page
+#
+def new_document(texts, frames=1, perpage=2, name="", pictures=0):
+    global redraws
+    del answers[:]
+    calls.clear()
+    redraws = 0
+    load_document(texts, frames, perpage, name, pictures)
+
+# Build the document (without resetting the counters)
+#
+def load_document(texts, frames=1, perpage=2, name="", pictures=0):
+    global page, docname, redraw, opened
+    stories.clear()
+    heads.clear()
+    previous.clear()
+    selection.clear()
+    del pages[:]
+    del images[:]
+    del selected[:]
+    page = 1
+    docname = name
+    redraw = True
+    opened = True
+    items = []
+    order = 0
+    for number, text in enumerate(texts, 1):
+        head = "Text{number}".format(number=number)
+        stories[head] = text
+        last = None
+        for link in range(frames):
+            frame = head if link == 0 else "{head}.{link}".format(head=head, link=link)
+            heads[frame] = head
+            if last:
+                previous[frame] = last
+            last = frame
+            items.append((frame, 4, order))
+            order += 1
+    for start in range(0, len(items), perpage):
+        pages.append(items[start:start + perpage])
+    if not pages:
+        pages.append([])
+    for number, items in enumerate(pages, 1):
+        for picture in range(pictures):
+            image = "Image{number}.{picture}".format(number=number, picture=picture)
+            images.append(image)
+            items.append((image, 2, len(items)))
+
+# Error of an unknown object (scribus.NoValidObjectError)
+#
+class NoValidObjectError(Exception):
+    pass
+
+def story(name):
+    try:
+        return heads[name]
+    except KeyError:
+        raise NoValidObjectError("Object not found") from None
+
+# Text
+#
+@bridge
+def getTextLength(name):
+    return len(stories[story(name)])
+
+@bridge
+def selectText(start, count, name):
+    head = story(name)
+    if start < 0 or start + count > len(stories[head]):
+        raise IndexError("Selection index out of bounds")
+    selection[head] = (start, count)
+
+@bridge
+def getText(name):
+    head = story(name)
+    start, count = selection.get(head, (0, 0))
+    return stories[head][start:start + count]
+
+@bridge
+def getAllText(name):
+    head = story(name)
+    start, count = selection.get(head, (0, 0))
+    if count:
+        return stories[head][start:start + count]
+    return stories[head]
+
+@bridge
+def getFrameText(name):
+    return stories[story(name)]
+
+@bridge
+def deleteText(name):
+    head = story(name)
+    start, count = selection.get(head, (0, 0))
+    text = stories[head]
+    stories[head] = text[:start] + text[start + count:]
+    selection[head] = (start, 0)
+
+@bridge
+def insertText(text, position, name):
+    head = story(name)
+    contents = stories[head]
+    if position == -1:
+        position = len(contents)
+    if position < 0 or position > len(contents):
+        raise IndexError("Insert position out of bounds")
+    stories[head] = contents[:position] + text + contents[position:]
+
+@bridge
+def getPrevLinkedFrame(name):
+    story(name)
+    return previous.get(name)
+
+# Pages and objects
+#
+@bridge
+def pageCount():
+    return len(pages)
+
+@bridge
+def currentPage():
+    return page
+
+@bridge
+def gotoPage(number):
+    global page
+    if not 1 <= number <= len(pages):
+        raise IndexError("page number out of range")
+    page = number
+
+@bridge
+def getPageItems():
+    return list(pages[page - 1])
+
+@bridge
+def getObjectType(name=None):
+    if name is None:
+        name = selected[0]
+    if name in images:
+        return "ImageFrame"
+    story(name)
+    return "TextFrame"
+
+@bridge
+def haveDoc():
+    return 1 if opened else 0
+
+@bridge
+def getDocName():
+    return docname
+
+# Documents: the files are the entries of files
+#
+@bridge
+def openDoc(name):
+    if name not in files:
+        raise IOError("Failed to open document")
+    texts, frames, perpage = files[name]
+    load_document(texts, frames, perpage, name)
+
+@bridge
+def saveDoc():
+    texts = [stories[head] for head in sorted(stories, key=lambda head: int(head[4:]))]
+    frames = len(heads) // max(len(stories), 1)
+    files[docname] = (texts, frames, len(pages[0]) or 2)
+
+@bridge
+def closeDoc():
+    global opened, docname
+    opened = False
+    docname = ""
+    stories.clear()
+    heads.clear()
+    del pages[:]
+    del selected[:]
+
+# Selection of objects
+#
+@bridge
+def selectionCount():
+    return len(selected)
+
+@bridge
+def getSelectedObject(number=0):
+    if number < len(selected):
+        return selected[number]
+    return ""
+
+@bridge
+def deselectAll():
+    del selected[:]
+
+@bridge
+def selectObject(name):
+    if name not in images:
+        story(name)
+    if name not in selected:
+        selected.append(name)
+
+# Dialogs, progress and status bar
+#
+@bridge
+def messageBox(caption, message, icon=ICON_NONE, button1=BUTTON_OK, button2=BUTTON_NONE, button3=BUTTON_NONE):
+    return button1 & ~BUTTON_DEFAULT
+
+@bridge
+def valueDialog(caption, message, default=""):
+    if answers:
+        return answers.pop(0)
+    return default
+
+@bridge
+def messagebarText(message):
+    pass
+
+@bridge
+def statusMessage(message):
+    pass
+
+@bridge
+def progressTotal(maximum):
+    pass
+
+@bridge
+def progressSet(value):
+    pass
+
+@bridge
+def progressReset():
+    pass
+
+@bridge
+def setRedraw(state):
+    global redraw
+    redraw = bool(state)
+
+@bridge
+def redrawAll():
+    global redraws
+    redraws += 1
+    if redrawlatency:
+        wait(redrawlatency)
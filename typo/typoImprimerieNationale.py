@@ -24,6 +24,16 @@ the directives of the French Imprimerie nationale (France)
  Start the script. A file dialog appears for choosing the target
 (simple frame or all the page)
 
+ Without any dialog (batch, farm of headless Scribus processes):
+
+    scribus -g -ns -py typoImprimerieNationale.py --workflow page|frame|lint
+            [--frame NAME] [--language fr-FR] [--report REPORT] [--save] -- document.sla
+
+ or with the environment (TYPO_WORKFLOW, TYPO_FRAME, TYPO_LANGUAGE,
+TYPO_REPORT, TYPO_SAVE). With --workflow on the command line, the script
+leaves Scribus with the exit status: 0 (done), 1 (lint: changes to do),
+2 (bad options, document or selection) or 3 (failure).
+
  DEVELOPMENT
 
 All the code are commented if you need to adapt this script for your
@@ -40,49 +50,68 @@ except ImportError:
     print("It can only be run from within Scribus.")
     sys.exit(1)
 
+import os
+import re
+import json
+import argparse
+import hashlib
+import time
+import queue
+import logging
+import logging.handlers
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-    
+
+# the engine is next to this script
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import typoEngine
+
 # variables definition
 #
-char = ''             # current character
-nextchar = ''         # next character
-prevchar = ''         # previous character
-c = 0                 # indice (cursor) (in normal case, c=char)
-page = 1              # initial page
 content = []          # whole text
 textlen = 0           # number of characters in text
 textlenshift = 0      # shift for having characters by page
-totalpagemove = 0     # number of cursor movements in a page after insert/remove characters/spaces
-spaceindic = 0        # remove space character indicator 
-singleindic = 0       # change single sign character indicator 
-doubleindic = 0       # change double sign character indicator
-double_thinindic = 0  # change double_thin sign character indicator
-dashindic = 0         # change dash sign character indicator
-langleindic = 0       # change left angle sign character indicator
-rangleindic = 0       # change right angle sign character indicator
-lparentindic = 0      # change left parenthesis sign character indicator
-rparentindic = 0      # change reight parenthesis sign character indicator
-workflow = "page"     # page (default) or frametext : working area for the script
+workflow = "page"     # page (default), frametext or lint (report only) : working area for the script
+reportformat = "json" # json or csv: format of the lint report
+bulkmode = True       # read/write the whole story at once (False: historical char by char mode)
+rewritelimit = 0      # bulk mode: a paragraph with more edits is rewritten at once, losing its character styles (0: never, see typoEngine.rewrite_paragraphs)
+language = "fr-FR"    # rule pack (see typoEngine.rule_packs): fr-FR, fr-CH, de, en
+batchedit = True      # no redraw of the document during the edits (see batch_edit)
+progressinterval = 250 # ms between two updates of the progress (see Progress)
+progresspercent = 1   # or percent of the text between two updates
 runtime = 0           # script runtime
+runseconds = 0.0      # script runtime, in seconds
+skippedstories = 0    # linked frames not processed again (story already processed)
+story_heads = {}      # frametext name -> name of the first frametext of its story
+index = None          # document index of the run (see document_index)
+pagenum = 0           # number of pages
+incremental = True    # skip the stories unchanged since the last run
+cache = {"rules": "", "stories": {}} # hashes of the stories after the last run (see load_cache)
+processedstories = 0  # stories processed
+cachedstories = 0     # stories skipped (unchanged since the last run)
+changedstories = 0    # stories whose text was changed by the run
+profiling = False     # record time, API calls and characters by rule and by frame (see profile_story)
+profileformat = "json" # json or pstats (cProfile format, for pstats or snakeviz)
+frameprofile = {}     # first frametext -> profile of its story
+memosize = 4096       # paragraphs kept in the memo of the engine, 0 for none (see typoEngine.ParagraphMemo)
+loglevel = "INFO"     # DEBUG (dumps of the texts), INFO, WARNING or ERROR: messages shown (see setup_log)
+logfile = None        # also write the messages in this file, from a background thread
+logexcerpt = 400      # max characters of a text in a message (0: the whole text)
+log = logging.getLogger("typo")
+headless = False      # no dialog at all, the options are given (see parse_options)
+commandline = False   # the workflow is given on the command line: leave Scribus with the exit status at the end
+reportpath = None     # report file of the run (lint: the changes to do, otherwise the stats)
+savedoc = False       # save the document at the end of the run
+framename = None      # frametexts of the frametext workflow without dialog, comma separated (default: the selected ones)
+textrange = None      # (start, end) of the frametext workflow: only these characters of the story (see process_range)
 
-# Space character definition
-#   s    (normal space)
-#   nbs  (non breaking space)
-#   nbts (non breaking thin space)
-#   ts   (thin space)
-#   n    (nothing, i.e all except space)
-non_breaking_space = u"\u00a0"      
-non_breaking_thin_space = u"\u202f"
-thin_space = u"\u2009"
-space = ' '
-spacelist = [space, thin_space, non_breaking_space, non_breaking_thin_space]
-
-# Other specific characters
-#
-lparent = u"\u0028"   # left parenthesis  (
-rparent = u"\u0029"   # right parenthesis )
-lsbracket = u"\u005b" # left square bracket  [
-rsbracket = u"\u005d" # right square bracket ]
+# Options of a run, as set above: the defaults of every run
+#    parse_options() sets these variables for its run, and restores them
+#    first, so an option of a run is never the default of the next one
+#    (several runs in a Scribus session: typoBatch.py, the Script menu)
+options = ("workflow", "headless", "commandline", "framename", "textrange", "language", "reportpath",
+           "reportformat", "savedoc", "loglevel", "logfile", "profiling", "profileformat", "rewritelimit")
+defaults = {name: globals()[name] for name in options}
 
 # Indicator function
 #
@@ -92,359 +121,398 @@ def info(message):
     # see an example at the end with .format function
     scribus.messagebarText(message)
 
-# basic functions for manipulating/testing characters
+# The typography itself is done by the typoEngine module (pure Python,
+# see typoEngine.py in the same directory). This script is only the
+# Scribus adapter: reading and writing the stories, dialogs and stats.
 #
 
-# define char, prevchar and char
-#        cur: current position in text
-def define_char(cur, textlen, text):
-    global char, prevchar, nextchar
-    # Possible blank or almost-blank page!
-    if textlen <= 1:
-        prevchar = ''
-        char = ''
-        nextchar = ''
-    else:    
-        # 1st character
-        if (cur == 0):
-            prevchar = ''
-            scribus.selectText(cur + 1, 1, text)
-            nextchar = scribus.getText(text)
-        # last character    
-        if (cur == textlen - 1):
-            nextchar = ''
-            scribus.selectText(cur - 1, 1, text)
-            prevchar = scribus.getText(text)
-        # other characters
-        if (cur > 0 and cur < textlen-1):
-            scribus.selectText(cur - 1, 1, text)
-            prevchar = scribus.getText(text)
-            scribus.selectText(cur + 1, 1, text) 
-            nextchar = scribus.getText(text)
-        if (cur > textlen-1):
-            print("ERROR: current text character pointer overflow!")
-            sys.exit(1)
-        scribus.selectText(cur, 1, text)
-        char = scribus.getText(text)
+# List-like access to the story of a frametext through the Scribus API
+#    used by the historical char by char mode: the engine works on it
+#    exactly like on a list of characters
+class ScribusText:
+    def __init__(self, text, textlen=None):
+        self.text = text                              # frametext name
+        if textlen is None:
+            textlen = scribus.getTextLength(text)     # whole text length over all the linked frames
+        self.textlen = textlen
+
+    def __len__(self):
+        return self.textlen
+
+    def __getitem__(self, position):
+        scribus.selectText(position, 1, self.text)
+        return scribus.getText(self.text)
+
+    def __setitem__(self, position, char):
+        scribus.selectText(position, 1, self.text)
+        scribus.deleteText(self.text)
+        scribus.insertText(char, position, self.text)
+
+    def __delitem__(self, position):
+        scribus.selectText(position, 1, self.text) # set 1 in variable if needs to replace more
+        scribus.deleteText(self.text)
+        self.textlen -= 1
+
+    def insert(self, position, char):
+        scribus.insertText(char, position, self.text)
+        self.textlen += 1
+
+# Scribus API with a count of the calls (profiling)
+#    used instead of the scribus module: scribus = BridgeCalls(scribus)
+class BridgeCalls:
+    def __init__(self, module):
+        self.module = module
+        self.calls = 0
 
-# Space character tests
+    def __getattr__(self, name):
+        attr = getattr(self.module, name)
+        if not callable(attr):
+            return attr
+        def call(*args, **kwargs):
+            self.calls += 1
+            return attr(*args, **kwargs)
+        return call
+
+# Batch edit: context of all the workflows
+#    the document is not redrawn during the run: with the redraw on, each
+#    selectText(), insertText() or deleteText() updates the canvas. The
+#    redraw is restored on exit, even after an error, and the document is
+#    redrawn once.
+#    The scripter of Scribus 1.5 has no undo transaction: each edit stays
+#    an undo step (the bulk mode makes one by changed span, not by character).
+@contextmanager
+def batch_edit():
+    if not batchedit:
+        yield
+        return
+    scribus.setRedraw(False)
+    try:
+        yield
+    finally:
+        scribus.setRedraw(True)
+        scribus.redrawAll()
+
+# First frametext of the story of a frametext
+#    linked frames share the same story: going back to the first frame
+#    gives a single name for the story. Each frame is asked only once
+#    (story_heads cache), so a chain of n frames costs n API calls.
+def story_head(text):
+    chain = []
+    frame = text
+    head = None
+    while head is None:
+        if frame in story_heads:
+            head = story_heads[frame]
+        else:
+            chain.append(frame)
+            previous = scribus.getPrevLinkedFrame(frame)
+            if previous:
+                frame = previous
+            else:
+                head = frame
+    for frame in chain:
+        story_heads[frame] = head
+    return head
+
+# Progress of a run, in characters
+#    the progress bar and the message bar are updated at most every
+#    progressinterval ms or every progresspercent % of the text, with the
+#    speed and the remaining time. step() is called by the engine for each
+#    character (char by char mode): between two clock checks, it is only an
+#    integer comparison.
+class Progress:
+    def __init__(self, total, label="Working"):
+        self.total = max(total, 1)               # characters of the run
+        self.label = label                       # current work, shown in the message bar
+        self.base = 0                            # characters of the stories already processed
+        self.start = time.perf_counter()
+        self.last = self.start                   # time of the last update
+        self.checkstep = max(1, self.total // 1000) # characters between two clock checks
+        self.nextcheck = 0
+        self.nextupdate = 0                      # characters of the next update (percent)
+        scribus.progressTotal(self.total)        # max progression bar
+
+    # Progress in the current story (cur: cursor in the story)
+    def step(self, cur, story=None):
+        done = self.base + cur
+        if done < self.nextcheck:
+            return
+        self.nextcheck = done + self.checkstep
+        now = time.perf_counter()
+        if done >= self.nextupdate or (now - self.last) * 1000 >= progressinterval:
+            self.update(done, now)
+
+    # End of a story of length characters
+    def story_done(self, length):
+        self.base += length
+        self.step(0)
+
+    def update(self, done, now):
+        self.last = now
+        self.nextupdate = done + self.total * progresspercent / 100
+        elapsed = now - self.start
+        speed = done / elapsed if elapsed > 0 else 0
+        left = int((self.total - done) / speed) if speed else 0
+        scribus.progressSet(min(done, self.total))   # progression bar step
+        info("""{label}: {percent} % - {speed:.0f} char/s - {minute} min {second} s left""".format(
+            label=self.label, percent=min(100, 100 * done // self.total), speed=speed,
+            minute=left // 60, second=left % 60))
+
+# Bulk mode: read the story once, correct it in memory, write back only
+# the changed spans. The cost is then linear in text length with a few
+# Scribus API calls by story, instead of ~6 calls by character.
 #
-def match_space(char):
-    if char in spacelist:
-        return True
-    else:
-        return False
 
-def not_match_space(char):
-    if char in spacelist:
-        return False
+# Write back the edit script into the story
+#    from right to left, so the positions on the left are still valid
+#    and no cursor has to be fixed
+#    step: progress function (see Progress.step), given the characters of
+#    the story already written (from its end)
+def write_edits(edits, oldlen, text, step=None):
+    for start, end, replacement in reversed(edits):
+        if step is not None:
+            step(oldlen - end)
+        if end > start:
+            scribus.selectText(start, end - start, text)
+            scribus.deleteText(text)
+        if replacement:
+            if start >= oldlen - (end - start):
+                scribus.insertText(replacement, -1, text) # end of story
+            else:
+                scribus.insertText(replacement, start, text)
+
+# Process a whole story in bulk mode
+#    text: name of a frametext of the story
+#    contents: the story text (getAllText)
+#    step: progress function, called while the edits are written
+#    returns the corrected text
+def typo_story(text, contents, step=None):
+    corrected, edits = typoEngine.typo_text(contents)
+    edits = typoEngine.rewrite_paragraphs(contents, edits, rewritelimit)
+    write_edits(edits, len(contents), text, step)
+    return corrected
+
+# Process a story, in bulk or char by char mode
+#    text: first frametext of the story
+#    step: progress function (see Progress.step): by character in the char
+#    by char mode, by edit written in bulk mode
+#    returns the initial and the corrected text
+def process_story(text, step=None):
+    global processedstories, cachedstories
+    scribus.selectText(0, 0, text) # no text selection: getAllText returns all the story
+    contents = scribus.getAllText(text)
+    # unchanged since the last run: nothing to do
+    if incremental and cache["stories"].get(text) == text_hash(contents):
+        cachedstories += 1
+        return contents, contents
+    if bulkmode or typoEngine.language != "fr-FR": # the char by char mode only knows French
+        corrected = typo_story(text, contents, step)
     else:
-        return True
+        typoEngine.typo_buffer(ScribusText(text, len(contents)), step=step)
+        scribus.selectText(0, 0, text)
+        corrected = scribus.getAllText(text)
+    processedstories += 1
+    cache["stories"][text] = text_hash(corrected)
+    return contents, corrected
 
-# Inserting, deleting and replacing characters
-#  - run only for ONE character, no need more in French -
-#
-def insert_char(char, position, text):
-    global c, totalpagemove
-    scribus.insertText(char, position, text)
-    c += 1 # current cursor has increased by 1
-    totalpagemove += 1
-
-def remove_char(position, text):
-    global c, totalpagemove
-    scribus.selectText(position, 1, text) # set 1 in variable if needs to replace more
-    scribus.deleteText(text)
-    c -= 1 # current cursor has decreased by 1
-    totalpagemove -= 1
-
-def replace_char(char, position, text):
-    scribus.selectText(position, 1, text)
-    scribus.deleteText(text)
-    scribus.insertText(char, position, text)
-    
-# Official French typo by Imprimerie nationale française
-#
-# signs    before/after      associated test function   associated correction function
-# char   prevchar/nextchar
-#
-# ss...    s                 FR_is_a_space              FR_remove_duplicated_spaces
-# .,       n/s               FR_is_a_single             FR_typo_for_single
-# ;!?      nbts/s            FR_is_a_double_thin        FR_typo_for_double_thin
-# :        nbs/s             FR_is_a_double             FR_typo_for_double
-# —        s/s               FR_is_a_dash               FR_typo_for_dash
-# «        s/nbs             FR_is_a_langle             FR_typo_for_rangle
-# »        nbs/s             FR_is_a_rangle             FR_typo_for_langle
-# ([       s/n               FR_is_a_lparent            FR_typo_for_oparent
-# )]       n/s               FR_is_a_rparent            FR_typo_for_cparent
-#
-# NOTE1 : … is n/s at the end and then begining of a sentence
-#           is also n/n between bracket for indicating a cut
-#         --> automation is not possible, because depends of the context.
-# NOTE2 : french single and double quotes (guillemet APL ', guillemet dactyloographique ",
-#         apostrophe culbuté ‘, apostrophe ’, virgule double „, guillemet simple gauche ‹
-#         et guillemet simple droite ›) follows obvious rules (s/n for right and n/s for left).
-#         but are not fully automated because they depend of the context. People who use it
-#         know normaly what they do!
-#         !!! English quotes “ ” should not normaly use
-#
-# All the following process is based on the fact that there is not more than
-# ONE space to analyse, then it is important to remove first the following space
-# characters. In French typo, in any case, it is not possible to have many
-# following space characters
-# If ever you adapt the script for other languages, pay attention at this point
+# Process a range of a story
+#    only the range and its margins are read (see typoEngine.range_edits)
+#    textlen: length of the story (getTextLength, already read for the progress)
+#    start, end: the range (end None: up to the end of the story)
+#    returns the initial and the corrected text of the range with its margins
+def process_range(text, textlen, start, end=None):
+    global processedstories
+    end = textlen if end is None else min(end, textlen)
+    start = min(start, end)
+    margin = typoEngine.range_margin
+    while True:
+        first = max(start - margin, 0)
+        last = min(end + margin, textlen)
+        if last == first:
+            return "", ""
+        scribus.selectText(first, last - first, text)
+        # getAllText: the selection in the whole story; getText would only give
+        # the selected characters shown in this frame of the story
+        window = scribus.getAllText(text)
+        if typoEngine.range_context(window, start - first, end - first, first == 0, last == textlen):
+            break
+        margin *= 4 # a long run of spaces and signs: read more context
+    edits = typoEngine.range_edits(window, start - first, end - first)
+    write_edits([(first + s, first + e, r) for s, e, r in edits], textlen, text)
+    scribus.selectText(0, 0, text)
+    processedstories += 1
+    cache["stories"].pop(text, None) # the whole story is not known anymore
+    return window, typoEngine.apply_edits(window, edits)
 
-# Clean following (duplicated) spaces
-#
-# all cases of space caracters
-def FR_is_a_space(char):
-    return (char == space) \
-        or (char == non_breaking_space) \
-        or (char == non_breaking_thin_space) \
-        or (char == thin_space)
-
-def FR_remove_duplicated_spaces(cur, text, prevchar, nextchar):
-    global spaceindic
-    # remove current space after a space
-    # (because this function is included in a loop, the next step(s) will purchase/achieve the job)
-    if (match_space(prevchar)):
-        remove_char(cur, text)
-        spaceindic += 1
-
-# Now it is time to produce all the functions of the French typo rules
-#        
-# .,       n/s      FR_is_a_single    FR_typo_for_single
+# Stories of the selected frametexts (their first frametext), each one once
 #
-def FR_is_a_single(char):
-    return (char == '.') or (char == ',')
-
-def FR_typo_for_single(cur, text, prevchar, nextchar):
-    global singleindic
-    # n/n  --> n/s
-    if (not_match_space(prevchar) and not_match_space(nextchar)):  
-        insert_char(space, cur + 1, text)
-        singleindic += 1
-    # n/s  --> n/s (swap 'general' s in 'good' s if ever)  
-    if (not_match_space(prevchar) and match_space(nextchar)):  
-        replace_char(space, cur + 1, text)
-        singleindic += 1
-    # s/n  --> n/s 
-    if (match_space(prevchar) and not_match_space(nextchar)):  
-        remove_char(cur - 1, text)
-        insert_char(space, cur, text) # shif of -1 because of previous delete
-        singleindic += 1
-    # s/s  --> n/s (swap 'general' s in 'good' s if ever)  
-    if (match_space(prevchar) and match_space(nextchar)):  
-        remove_char(cur - 1, text)
-        replace_char(space, cur, text) # shif of -1 because of previous delete
-        singleindic += 1
-
-# ;!?      nbts/s         FR_is_a_double_thin       FR_typo_for_double_thin
+def selected_stories():
+    stories = []
+    for number in range(scribus.selectionCount()):
+        head = story_head(scribus.getSelectedObject(number))
+        if head not in stories:
+            stories.append(head)
+    return stories
+
+# Process a story and record its profile (profiling)
+#    time, Scribus API calls, characters scanned and modified,
+#    and the profile of each rule (see typoEngine.profile_rule)
+def profile_story(text, step=None):
+    typoEngine.reset_profile()
+    calls = scribus.calls
+    start = time.perf_counter()
+    contents, corrected = process_story(text, step)
+    frameprofile[text] = {"time": time.perf_counter() - start,
+                          "api": scribus.calls - calls,
+                          "scanned": len(contents),
+                          "modified": typoEngine.changed_chars(contents, corrected),
+                          "rules": typoEngine.default_state.profile}
+    return contents, corrected
+
+# Write the profile next to the document
 #
-def FR_is_a_double_thin(char):
-    return (char == ';') or (char == '!') or (char == '?')
-
-def FR_typo_for_double_thin(cur, text, prevchar, nextchar):
-    global double_thinindic
-    # s/s  --> nbts/s (swap if ever needs)
-    if (match_space(prevchar) and match_space(nextchar)):  
-        replace_char(non_breaking_thin_space, cur - 1, text)
-        replace_char(space, cur + 1, text)
-        double_thinindic += 1
-    # s/n  --> nbts/s 
-    if (match_space(prevchar) and not_match_space(nextchar)):  
-        replace_char(non_breaking_thin_space, cur - 1, text)
-        insert_char(space, cur + 1, text)
-        double_thinindic += 1
-    # n/n  --> nbts/s 
-    if (not_match_space(prevchar) and not_match_space(nextchar)):  
-        insert_char(non_breaking_thin_space, cur, text)
-        insert_char(space, cur + 2, text)
-        double_thinindic += 1
-    # n/s  --> nbts/s
-    if (not_match_space(prevchar) and match_space(nextchar)):  
-        insert_char(non_breaking_thin_space, cur, text)
-        replace_char(space, cur + 2, text)
-        double_thinindic += 1
-
-# :        nbs/s             FR_is_a_double             FR_typo_for_double
+def write_profile():
+    docname = scribus.getDocName()
+    name = "typo-profile." + ("prof" if profileformat == "pstats" else "json")
+    if docname:
+        path = docname + "." + name
+    else:
+        path = os.path.join(os.path.expanduser("~"), name)
+    if profileformat == "pstats":
+        with open(path, "wb") as f:
+            typoEngine.write_profile(frameprofile, f, "pstats")
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            typoEngine.write_profile(frameprofile, f)
+    return path
+
+# Summary of the profile for the stats dialog
+#    the rules, then the slowest frames
+def profile_table(frames=5):
+    rules = {}
+    for frame in frameprofile.values():
+        for rule, entry in frame["rules"].items():
+            total = rules.setdefault(rule, {"calls": 0, "time": 0.0, "scanned": 0, "modified": 0, "api": 0})
+            for key in total:
+                total[key] += entry[key]
+    row = """<tr><td>{name}</td><td style="text-align:right">{time:.1f}</td>
+    <td style="text-align:right">{calls}</td><td style="text-align:right">{api}</td>
+    <td style="text-align:right">{scanned}</td><td style="text-align:right">{modified}</td></tr>"""
+    lines = ["""<table>
+    <tr><th>Règle / cadre</th><th>ms</th><th>Appliquée</th><th>Appels API</th><th>Lus</th><th>Modifiés</th></tr>"""]
+    for rule, entry in sorted(rules.items(), key=lambda item: -item[1]["time"]):
+        lines.append(row.format(name=rule, time=entry["time"] * 1000, calls=entry["calls"], api=entry["api"],
+                                scanned=entry["scanned"], modified=entry["modified"]))
+    slowest = sorted(frameprofile.items(), key=lambda item: -item[1]["time"])[:frames]
+    for name, entry in slowest:   # api: Scribus API calls of the frame
+        lines.append(row.format(name="<i>" + name + "</i>", time=entry["time"] * 1000,
+                                calls="", api=entry["api"], scanned=entry["scanned"],
+                                modified=entry["modified"]))
+    lines.append("</table>")
+    lines.append("<i>Profilage : la mémoire des paragraphes n'est pas utilisée.</i>")
+    return "\n".join(lines)
+
+# Incremental run
 #
-def FR_is_a_double(char):
-    return char == ':'
-
-def FR_typo_for_double(cur, text, prevchar, nextchar):
-    global doubleindic
-    # s/s  --> nbs/s (swap if ever needs)
-    if (match_space(prevchar) and match_space(nextchar)):  
-        replace_char(non_breaking_space, cur - 1, text)
-        replace_char(space, cur + 1, text)
-        doubleindic += 1
-    # s/n  --> nbs/s 
-    if (match_space(prevchar) and not_match_space(nextchar)):  
-        replace_char(non_breaking_space, cur - 1, text)
-        insert_char(space, cur + 1, text)
-        doubleindic += 1
-    # n/n  --> nbs/s 
-    if (not_match_space(prevchar) and not_match_space(nextchar)):  
-        insert_char(non_breaking_space, cur, text)
-        insert_char(space, cur + 2, text)
-        doubleindic += 1
-    # n/s  --> nbs/s
-    if (not_match_space(prevchar) and match_space(nextchar)):  
-        insert_char(non_breaking_space, cur, text)
-        replace_char(space, cur + 2, text)
-        doubleindic += 1
-
-# —        s/s               FR_is_a_dash               FR_typo_for_dash
+# The hash of each story after processing is kept in a cache file next to
+# the document (<document>.typo.json). On the next run, a story with the
+# same hash has not changed since: it is skipped. The cache is forgotten
+# when the rules change.
+#    {"rules": version of the rules, "stories": {first frametext: hash}}
 #
-def FR_is_a_dash(char):
-    return char == '—'
-
-def FR_typo_for_dash(cur, text, prevchar, nextchar):
-    global dashindic
-    # s/s  --> s/s (swap if ever needs)
-    if (match_space(prevchar) and match_space(nextchar)):  
-        replace_char(space, cur - 1, text)
-        replace_char(space, cur + 1, text)
-        dashindic += 1
-    # s/n  --> s/s 
-    if (match_space(prevchar) and not_match_space(nextchar)):  
-        replace_char(space, cur - 1, text)
-        insert_char(space, cur + 1, text)
-        dashindic += 1
-    # n/n  --> s/s 
-    if (not_match_space(prevchar) and not_match_space(nextchar)):  
-        insert_char(space, cur, text)
-        insert_char(space, cur + 2, text)
-        dashindic += 1
-    # n/s  --> s/s
-    if (not_match_space(prevchar) and match_space(nextchar)):  
-        insert_char(space, cur, text)
-        replace_char(space, cur + 2, text)
-        dashindic += 1
-
-# «        s/nbs             FR_is_a_rangle             FR_typo_for_rangle
+def text_hash(contents):
+    return hashlib.sha1(contents.encode("utf-8")).hexdigest()
+
+def cache_path():
+    docname = scribus.getDocName()
+    if not docname:
+        return None # document never saved
+    return docname + ".typo.json"
+
+def load_cache():
+    global cache
+    cache = {"rules": typoEngine.rules_version(), "stories": {}}
+    path = cache_path()
+    if not incremental or path is None or not os.path.exists(path):
+        return
+    try:
+        with open(path, encoding="utf-8") as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        log.warning("unreadable cache file %s", path)
+        return
+    if previous.get("rules") == cache["rules"]:
+        cache["stories"] = previous.get("stories", {})
+
+def save_cache():
+    path = cache_path()
+    if not incremental or path is None:
+        return
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=1)
+    except OSError:
+        log.warning("cannot write cache file %s", path)
+
+# Document index
 #
-def FR_is_a_langle(char):
-    return char == '«'
-
-def FR_typo_for_langle(cur, text, prevchar, nextchar):
-    global langleindic
-    # s/s  --> s/nbs (swap if ever needs)
-    if (match_space(prevchar) and match_space(nextchar)):  
-        replace_char(space, cur - 1, text)
-        replace_char(non_breaking_space, cur + 1, text)
-        langleindic += 1
-    # s/n  --> s/nbs 
-    if (match_space(prevchar) and not_match_space(nextchar)):  
-        replace_char(space, cur - 1, text)
-        insert_char(non_breaking_space, cur + 1, text)
-        langleindic += 1
-    # n/n  --> s/nbs 
-    if (not_match_space(prevchar) and not_match_space(nextchar)):  
-        insert_char(space, cur, text)
-        insert_char(non_breaking_space, cur + 2, text)
-        langleindic += 1
-    # n/s  --> s/nbs
-    if (not_match_space(prevchar) and match_space(nextchar)):  
-        insert_char(space, cur, text)
-        replace_char(non_breaking_space, cur + 2, text)
-        langleindic += 1
-
-# »        nbs/s             FR_is_a_langle             FR_typo_for_langle
+# Built once for the run, with the fewest API calls: gotoPage() and
+# getPageItems() for each page, getPrevLinkedFrame() for each frametext
+# and getTextLength() for each story. Then the page and lint workflows use it
+# instead of moving from page to page (the frametext workflow only reads
+# the selected stories, whatever the size of the document).
+#    name -> {"page": page number, "type": item type (4 = frametext),
+#             "head": first frametext of the story (frametexts only),
+#             "textlen": length of the whole story (frametexts only)}
 #
-def FR_is_a_rangle(char):
-    return char == '»'
-
-def FR_typo_for_rangle(cur, text, prevchar, nextchar):
-    global rangleindic
-    # s/s  --> nbs/s (swap if ever needs)
-    if (match_space(prevchar) and match_space(nextchar)):  
-        replace_char(non_breaking_space, cur - 1, text)
-        replace_char(space, cur + 1, text)
-        rangleindic += 1
-    # s/n  --> nbs/s 
-    if (match_space(prevchar) and not_match_space(nextchar)):  
-        replace_char(non_breaking_space, cur - 1, text)
-        insert_char(space, cur + 1, text)
-        rangleindic += 1
-    # n/n  --> nbs/s 
-    if (not_match_space(prevchar) and not_match_space(nextchar)):  
-        insert_char(non_breaking_space, cur, text)
-        insert_char(space, cur + 2, text)
-        rangleindic += 1
-    # n/s  --> nbs/s
-    if (not_match_space(prevchar) and match_space(nextchar)):  
-        insert_char(non_breaking_space, cur, text)
-        replace_char(space, cur + 2, text)
-        rangleindic += 1
-
-# ([       s/n               FR_is_a_lparent            FR_typo_for_lparent
+def document_index():
+    global index
+    if index is None:
+        index = build_index()
+    return index
+
+def build_index():
+    global pagenum
+    frames = {}
+    lengths = {}       # first frametext -> length of the story
+    current = scribus.currentPage()
+    pagenum = scribus.pageCount()
+    for number in range(1, pagenum + 1):
+        scribus.gotoPage(number)
+        for name, itemtype, order in scribus.getPageItems(): # [('Text1', 4, 0), ('Image1', 2, 1), ...]
+            frame = {"page": number, "type": itemtype, "head": None, "textlen": 0}
+            if itemtype == 4:
+                head = story_head(name)
+                if head not in lengths:
+                    lengths[head] = scribus.getTextLength(head) # whole text length over all the linked frames
+                frame["head"] = head
+                frame["textlen"] = lengths[head]
+            frames[name] = frame
+    scribus.gotoPage(current) # back to the page of the user
+    return frames
+
+# Stories of the document (their first frametext), in the page order
 #
-def FR_is_a_lparent(char):
-    return (char == lparent) or (char == lsbracket)
-
-def FR_typo_for_lparent(cur, text, prevchar, nextchar):
-    global lparentindic
-    # s/s  --> s/n 
-    if (match_space(prevchar) and match_space(nextchar)):  
-        replace_char(space, cur - 1, text)
-        remove_char(cur + 1, text)
-        lparentindic += 1
-    # s/n  --> s/n 
-    if (match_space(prevchar) and not_match_space(nextchar)):  
-        replace_char(space, cur - 1, text)
-        lparentindic += 1
-    # n/n  --> s/n 
-    if (not_match_space(prevchar) and not_match_space(nextchar)):  
-        insert_char(space, cur, text)
-        lparentindic += 1
-    # n/s  --> s/n
-    if (not_match_space(prevchar) and match_space(nextchar)):  
-        insert_char(space, cur, text)
-        remove_char(cur + 2, text)
-        lparentindic += 1
-
-# )]       n/s               FR_is_a_rparent            FR_typo_for_rparent
+def index_stories(index):
+    stories = []
+    seen = set()
+    for name, frame in index.items():
+        if frame["type"] == 4 and frame["head"] not in seen:
+            seen.add(frame["head"])
+            stories.append(frame["head"])
+    return stories
+
+# Frametexts of a story
 #
-def FR_is_a_rparent(char):
-    return (char == ')') or (char == ']')
-
-def FR_typo_for_rparent(cur, text, prevchar, nextchar):
-    global rparentindic
-    # s/s  --> n/s 
-    if (match_space(prevchar) and match_space(nextchar)):  
-        remove_char(cur - 1, text)
-        replace_char(space, cur, text)
-        rparentindic += 1
-    # s/n  --> n/s 
-    if (match_space(prevchar) and not_match_space(nextchar)):
-        remove_char(cur - 1, text)
-        insert_char(space, cur, text)
-        rparentindic += 1
-    # n/n  --> n/s 
-    if (not_match_space(prevchar) and not_match_space(nextchar)):  
-        insert_char(space, cur + 1, text)
-        rparentindic += 1
-    # n/s  --> n/s
-    if (not_match_space(prevchar) and match_space(nextchar)):  
-        replace_char(space, cur + 1, text)
-        rparentindic += 1
-
-# List of tuple functions for general purpose at the final loop
-# --> inconvenience: all the function should have the same arguments
+def story_frames(index, head):
+    return [name for name, frame in index.items() if frame["head"] == head]
+
+# New length of a story after processing
 #
-FR_typo_todo = ((FR_is_a_space, FR_remove_duplicated_spaces), \
-                (FR_is_a_single, FR_typo_for_single), \
-                (FR_is_a_double_thin, FR_typo_for_double_thin), \
-                (FR_is_a_double, FR_typo_for_double), \
-                (FR_is_a_dash, FR_typo_for_dash), \
-                (FR_is_a_rangle, FR_typo_for_rangle), \
-                (FR_is_a_langle, FR_typo_for_langle), \
-                (FR_is_a_lparent, FR_typo_for_lparent), \
-                (FR_is_a_rparent, FR_typo_for_rparent) \
-                )
-
-# That's all for the typo.
+def update_index(index, head, textlen):
+    for name in story_frames(index, head):
+        index[name]["textlen"] = textlen
+
 # now general setup for the user
 
 # Welcome banner for explicit the goal of the script.
@@ -470,12 +538,14 @@ def welcome_banner():
 # Setup the script: for frametext or for all the page?
 #       exit if no selection or bad selection object
 def setup_script():
-    global workflow
+    global workflow, textrange
     info("Configuration du script")
     while True:
         message_setup = """<center>Appliquer la typographie</center>
-        <ul> 1 : sur une zone de texte (à sélectionner à la souris auparavant)</ul>
+        <ul> 1 : sur une ou plusieurs zones de texte (à sélectionner à la souris auparavant)</ul>
         <ul> 2: sur tout le document (choix par défaut)</ul>
+        <ul> 3 : vérifier tout le document, sans le modifier (rapport)</ul>
+        <ul> 4 : sur une partie du texte de la zone sélectionnée (positions des caractères dans l'histoire)</ul>
         <ul> 0 : pour quitter le processus</ul>"""
         flow = scribus.valueDialog("Domaine d'application", message_setup, "2")
         if flow == "2":
@@ -484,53 +554,213 @@ def setup_script():
         if flow == "1":
             workflow = "frametext"
             break
+        if flow == "3":
+            workflow = "lint"
+            break
+        if flow == "4":
+            message_range = """<center>Positions des caractères à traiter dans l'histoire
+            de la zone,<br> comptées depuis le début du premier cadre chaîné,<br>
+            sous la forme début:fin (fin vide : jusqu'à la fin du texte)</center>"""
+            textrange = parse_range(scribus.valueDialog("Partie du texte", message_range, "0:"))
+            if textrange:
+                workflow = "frametext"
+                break
         if flow == "0":
             sys.exit(1)
         else:
-            message_warn = """<center>Vous devez répondre par 1 (zone de texte) <br>
-            ou 2 (tout le document)</center>"""
+            message_warn = """<center>Vous devez répondre par 1 (zone de texte), <br>
+            2 (tout le document), 3 (vérification) ou 4 (partie de texte, début:fin)</center>"""
             scribus.messageBox("Information",
                                message_warn,
                                icon=scribus.ICON_WARNING,
                                button1=scribus.BUTTON_OK)
     # check if a frametext has been selected
     if workflow == "frametext":
-         # no selection
-        if scribus.selectionCount() == 0:
-            message_warn = """Aucun objet n'est sélectionné.\n
-            Sélectionnez un cadre de texte et recommencez. """
-            scribus.messageBox('Scribus - Erreur',
-                               message_warn,
-                               icon=scribus.ICON_WARNING,
-                               button1=scribus.BUTTON_OK)
-            sys.exit(2)
-        # multi-selection
-        elif scribus.selectionCount() > 1:
-            message_warn = """<center>Ce script ne peut pas fonctionner 
-            lorsque plusieurs objets sont sélectionnés.<br>
-            Veuillez ne sélectionner qu'un seul cadre de texte, <br>
-            puis recommencez.</center> """
-            scribus.messageBox('Scribus - Erreur',
-                               message_warn,
-                               icon=scribus.ICON_WARNING,
-                               button1=scribus.BUTTON_OK)
-            sys.exit(2)
-        # check if selection is a real frametext
-        else:
-            list_item = scribus.getPageItems() # [('Text1', 4, 0), ('Image1', 2, 1), ...]
-            for item in list_item:
-                if (item[1] != 4):
-                    message_warn = """ L'objet sélectionné n'est pas un cadre de texte.\n
-                    Veuillez sélectionner un cadre de texte, puis recommencez. """
-                    scribus.messageBox('Scribus - Erreur',
-                                       message_warn,
-                                       icon=scribus.ICON_WARNING,
-                                       button1=scribus.BUTTON_OK)
-                    sys.exit(2)
+        check_selection()
+
+# Range of characters start:end (end may be empty: up to the end)
+#    returns (start, end), end is None for the end of the story, or None if invalid
+def parse_range(value):
+    try:
+        start, end = value.split(":")
+        start = int(start or 0)
+        end = int(end) if end.strip() else None
+    except ValueError:
+        return None
+    if start < 0 or (end is not None and end < start):
+        return None
+    return start, end
+
+# Check that the selection is made of frametexts
+#       exit if no selection or bad selection object
+#       only the selected objects are checked (the other objects of the
+#       page may be anything)
+def check_selection():
+    count = scribus.selectionCount()
+     # no selection
+    if count == 0:
+        abort("""Aucun objet n'est sélectionné.\n
+        Sélectionnez un cadre de texte et recommencez. """)
+    # a range is in a single frametext
+    if textrange and count > 1:
+        abort("""<center>Une partie de texte ne peut être traitée
+        que dans un seul cadre de texte.<br>
+        Veuillez ne sélectionner qu'un seul cadre de texte, <br>
+        puis recommencez.</center> """)
+    # check if each selected object is a real frametext
+    for number in range(count):
+        name = scribus.getSelectedObject(number)
+        if not is_textframe(name):
+            abort(""" L'objet sélectionné {name} n'est pas un cadre de texte.\n
+            Veuillez sélectionner un cadre de texte, puis recommencez. """.format(name=name))
+
+# Is an object a frametext?
+#    one getObjectType() call (the selection is checked before any index is built)
+def is_textframe(name):
+    return scribus.getObjectType(name) == "TextFrame"
+
+# Stop the script on an error
+#    a warning dialog, or only the log without dialog (headless)
+#    status: exit status of the script
+def abort(message, status=2):
+    if headless:
+        log.error(" ".join(re.sub("<[^>]*>", " ", message).split()))
+    else:
+        scribus.messageBox('Scribus - Erreur',
+                           message,
+                           icon=scribus.ICON_WARNING,
+                           button1=scribus.BUTTON_OK)
+    sys.exit(status)
+
+# Headless mode
+#
+# With a workflow given on the command line or in the environment, the
+# script runs without any dialog (scribus -g -py, farm of Scribus
+# processes): the stats and the lint report are written in the report
+# file and in the log, and the exit status tells the result:
+#    0: done (lint: nothing to change)
+#    1: lint: changes to do
+#    2: bad options, no document or bad selection
+#    3: failure (exception)
+#
+workflows = {"frame": "frametext", "frametext": "frametext", "page": "page", "lint": "lint"}
+
+# Options of the run
+#    command line: scribus -g -py typoImprimerieNationale.py --workflow page ...
+#    environment: TYPO_WORKFLOW=page ... (the command line wins)
+#    without workflow, the dialogs ask for it
+def parse_options(argv):
+    global headless, commandline, workflow, framename, textrange, language, reportpath, reportformat, savedoc, loglevel, logfile
+    global profiling, profileformat, rewritelimit
+    globals().update(defaults)
+    environ = os.environ
+    parser = argparse.ArgumentParser(prog="typoImprimerieNationale.py",
+                                     description="French typography of the Imprimerie nationale in Scribus")
+    parser.add_argument("--workflow",
+                        help="frame, page or lint: run without any dialog (TYPO_WORKFLOW)")
+    parser.add_argument("--frame", default=environ.get("TYPO_FRAME", framename),
+                        help="frametexts of the frame workflow, comma separated, default: the selected ones (TYPO_FRAME)")
+    parser.add_argument("--range", default=environ.get("TYPO_RANGE"),
+                        help="START:END: only these characters of the story of the frame workflow, counted from the start of its first linked frame (TYPO_RANGE)")
+    parser.add_argument("--language", default=environ.get("TYPO_LANGUAGE", language),
+                        help="rule pack: " + ", ".join(typoEngine.rule_packs) + " (TYPO_LANGUAGE, default: %(default)s)")
+    parser.add_argument("--report", default=environ.get("TYPO_REPORT", reportpath),
+                        help="report file: stats (.json) or lint report (.json or .csv) (TYPO_REPORT)")
+    parser.add_argument("--save", action="store_true",
+                        default=environ.get("TYPO_SAVE", str(savedoc)).lower() in ("1", "true", "yes"),
+                        help="save the document at the end (TYPO_SAVE=1)")
+    parser.add_argument("--rewrite", type=int, default=int(environ.get("TYPO_REWRITE", rewritelimit)),
+                        help="rewrite at once a paragraph with more edits: fewer API calls, "
+                             "but its character styles are lost (TYPO_REWRITE, default: %(default)s, never)")
+    parser.add_argument("--profile", nargs="?", const="json", choices=("json", "pstats"),
+                        default=environ.get("TYPO_PROFILE") or (profileformat if profiling else None),
+                        help="profile the rules and the frames, written next to the document in json (default) "
+                             "or pstats format (TYPO_PROFILE=json)")
+    parser.add_argument("--log-level", default=environ.get("TYPO_LOGLEVEL", loglevel),
+                        help="DEBUG, INFO, WARNING or ERROR (TYPO_LOGLEVEL, default: %(default)s)")
+    parser.add_argument("--log-file", default=environ.get("TYPO_LOGFILE", logfile),
+                        help="also write the log in this file (TYPO_LOGFILE)")
+    args = parser.parse_args(argv[1:])
+    # a TYPO_WORKFLOW left in the environment of the GUI must not make the
+    # script of the Script menu quit Scribus
+    commandline = bool(args.workflow)
+    if not args.workflow:
+        args.workflow = environ.get("TYPO_WORKFLOW")
+    if args.workflow:
+        headless = True
+        if args.workflow not in workflows:
+            parser.error("unknown workflow " + repr(args.workflow) + ", choose frame, page or lint")
+        workflow = workflows[args.workflow]
+    if typoEngine.find_pack(args.language) is None:
+        parser.error("no rule pack for language " + repr(args.language))
+    if args.profile not in (None, "json", "pstats"):
+        parser.error("unknown profile format " + repr(args.profile) + ", choose json or pstats")
+    if not isinstance(getattr(logging, args.log_level.upper(), None), int):
+        parser.error("unknown log level " + repr(args.log_level))
+    framename = args.frame
+    textrange = None
+    if args.range:
+        textrange = parse_range(args.range)
+        if textrange is None:
+            parser.error("bad range " + repr(args.range) + ", START:END expected")
+        if workflow != "frametext":
+            parser.error("--range is only for the frame workflow")
+    language = typoEngine.find_pack(args.language)
+    reportpath = args.report
+    if reportpath and reportpath.endswith(".csv"):
+        reportformat = "csv"
+    savedoc = args.save
+    rewritelimit = args.rewrite
+    profiling = args.profile is not None
+    profileformat = args.profile or profileformat
+    loglevel = args.log_level
+    logfile = args.log_file
+
+# Setup of a headless run: the document and the frametext
+#
+def headless_setup():
+    if not scribus.haveDoc():
+        abort("Aucun document ouvert.")
+    if workflow == "frametext":
+        if framename:
+            scribus.deselectAll()
+            for name in framename.split(","):
+                try:
+                    scribus.selectObject(name.strip())
+                except scribus.NoValidObjectError:
+                    abort("Cadre de texte inconnu : " + name)
+        check_selection()
+
+# Summary of the run
+#
+def run_summary():
+    return {"document": scribus.getDocName(),
+            "workflow": workflow,
+            "language": typoEngine.language,
+            "seconds": runseconds,
+            "stories": processedstories,
+            "cached": cachedstories,
+            "changed": changedstories,
+            "skipped": skippedstories,
+            "indicators": typoEngine.stats(),
+            "memo": typoEngine.memo.stats()}
+
+# Final stats without dialog: in the log and in the report file
+#
+def headless_stats():
+    summary = run_summary()
+    log.info("%s: %s stories (%s unchanged), %s changes in %.1f s",
+             summary["document"] or "(document)", summary["stories"], summary["cached"],
+             sum(summary["indicators"].values()), summary["seconds"])
+    if reportpath:
+        with open(reportpath, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=1)
+            f.write("\n")
 
 # Final stats
 #
 def final_stats():
+    state = typoEngine.default_state   # indicators of the run
     # (other solution is to use import Template)
     # Limitation of presentation is Rich Text limitations
     message_stats = """
@@ -577,59 +807,132 @@ def final_stats():
     </tr>
     </table>
     <br>
+    <center>Histoires traitées : {processed}, inchangées depuis la dernière fois : {cached}</center>
+    <center>Cadres chaînés déjà traités : {skipped}</center>
+    <center>Paragraphes déjà corrigés (mémoire) : {hits}, corrigés : {misses}</center>
     <center>Temps de traitement : {rtime}</center>
-    """.format(single=singleindic, space=spaceindic, double_thin=double_thinindic,
-               double=doubleindic, dash=dashindic, langle=langleindic,
-               rangle=rangleindic, lparent=lparentindic, rparent=rparentindic,
+    {profile}
+    """.format(profile=profile_table() if profiling else "",
+               single=state.singleindic, space=state.spaceindic,
+               double_thin=state.double_thinindic, double=state.doubleindic,
+               dash=state.dashindic, langle=state.langleindic,
+               rangle=state.rangleindic, lparent=state.lparentindic,
+               rparent=state.rparentindic, processed=processedstories,
+               cached=cachedstories, skipped=skippedstories,
+               hits=typoEngine.memo.hits, misses=typoEngine.memo.misses,
                rtime=runtime, color1="#FFFFF0", color2="#FFFBCD")
     scribus.messageBox('Statistiques du traitement',
                        message_stats,
                        icon=scribus.ICON_INFORMATION,
                        button1=scribus.BUTTON_OK)
 
+# Write the lint report next to the document and show a summary
+#
+def lint_report(report):
+    docname = scribus.getDocName()
+    if reportpath:
+        path = reportpath
+    elif docname:
+        path = docname + ".typo-report." + reportformat
+    else:
+        path = os.path.join(os.path.expanduser("~"), "typo-report." + reportformat)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        typoEngine.write_report(report, f, reportformat)
+    if headless:
+        log.info("%s changes to do, report: %s", len(report), path)
+        return
+    message_lint = """<center>{count} correction(s) typographique(s) à faire.<br>
+    Le document n'a pas été modifié.<br><br>
+    Rapport : {path}</center>""".format(count=len(report), path=path)
+    scribus.messageBox('Vérification typographique',
+                       message_lint,
+                       icon=scribus.ICON_INFORMATION if not report else scribus.ICON_WARNING,
+                       button1=scribus.BUTTON_OK)
+
 # Computes the process time and returns human lisible time
 #    
 def process_time(final_time, init_time):
-    global runtime
+    global runtime, runseconds
     rtime = final_time - init_time
+    runseconds = rtime.total_seconds()
     min = rtime.seconds // 60
     sec = rtime.seconds - 60*min
     runtime = """{minute} min {second} s""".format(minute=min, second=sec)
     return runtime
 
-# print debug info
+# Log
+#
+# The messages go through the logging module: a message is only built if
+# its level is shown (loglevel), so the production runs (INFO) never format
+# the dumps of the texts (DEBUG). A text in a message is an Excerpt, cut
+# when the message is written. With logfile, the messages are written in
+# the file by a background thread (QueueListener): the script never waits
+# for the disk.
 #
+
+# Excerpt of a text: the beginning and the end of a long text
+#
+class Excerpt:
+    def __init__(self, text, limit=None):
+        self.text = text
+        self.limit = logexcerpt if limit is None else limit
+
+    def __str__(self):
+        if not self.limit or len(self.text) <= self.limit:
+            return self.text
+        half = self.limit // 2
+        return "{head}\n[... {cut} characters ...]\n{tail}".format(
+            head=self.text[:half], cut=len(self.text) - 2 * half, tail=self.text[-half:])
+
+# Setup the log of the run
+#    returns the QueueListener writing the file (stop it at the end), or None
+def setup_log():
+    log.setLevel(getattr(logging, loglevel.upper()))
+    log.propagate = False
+    for handler in log.handlers[:]: # a previous run in the same Scribus session
+        log.removeHandler(handler)
+    console = logging.StreamHandler(sys.stdout) # the Scribus console
+    console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    log.addHandler(console)
+    if not logfile:
+        return None
+    records = queue.Queue()
+    log.addHandler(logging.handlers.QueueHandler(records))
+    handler = logging.FileHandler(logfile, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    return listener
+
+# print debug info
+#    only at DEBUG level: the call is skipped otherwise (see main)
 def print_debug(c, page, pagenum, list_item, text, textlen,
                 textlen2, textlenshift, totalpagemove, contents):
-    debug = """
+    log.debug("""
 ********************************************************************
 * DEBUG mode
-*   Page {page} of {pagenum}
-*       Page item: {list_item}
-*        Current processing text: ++++ {text} ++++
-*         => textlen={textlen} (textlen2={textlen2}) 
-*            textlenshift={textlenshift}  totalpagemove={totalpagemove}
-*            Initial cursor is {c}
+*   Page %s of %s
+*       Page item: %s
+*        Current processing text: ++++ %s ++++
+*         => textlen=%s (textlen2=%s) 
+*            textlenshift=%s  totalpagemove=%s
+*            Initial cursor is %s
 ********************************************************************
 
 === Current text  =======
-{contents}
+%s
 === End current text ====
-    """.format(c=c, page=page, pagenum=pagenum, list_item=list_item,
-               text=text, textlen=textlen, textlen2=textlen2,
-               textlenshift=textlenshift, totalpagemove=totalpagemove,
-               contents=contents)
-    print(debug)
+    """, page, pagenum, list_item, text, textlen, textlen2,
+              textlenshift, totalpagemove, c, Excerpt(contents))
 
 # Print rebuild text after the loop
 #
 def rebuild_text(text):
-    rebuilt= """
+    log.debug("""
 *** Rebuilt text  ******
-{text}
+%s
 *** End rebuilt text  **
-    """.format(text=text)
-    print(rebuilt)
+    """, Excerpt(text))
 
 # Select first frametext objetc for all the document run
 #    * Selected object is requiere to find linked frametext
@@ -637,125 +940,158 @@ def rebuild_text(text):
 #    * The script will then run on the first found page
 #
 def select_firstframetext():
-    global page, pagenum
-    selectframetext = False        # flag for existence
-    deselectAll()                  # unselect all
-    pagenum = scribus.pageCount()  # page number
-    # test all objets per page searching a frame
-    while (page <= pagenum):
-        scribus.gotoPage(page)
-        lobjects = scribus.getAllObjects()
-        for obj in lobjects:
-            textframe = re.match('Text', obj) # Text + a digit
-            if textframe :
-                first_text = obj
-                scribus.selectObject(obj)
-                selectframetext = True
-                break
-            else:
-                 page += 1
-        if selectframetext:
-            print("\n>>>> First selected frametext object is:", first_text)
-            break
-        page += 1
-    if ( selectframetext == False ):
-        # add a Scribus dialog to inform fail
-        print("DEBUG: No frametext object in document!")
+    index = document_index()
+    for name, frame in index.items():
+        if frame["type"] == 4:
+            scribus.deselectAll()                  # unselect all
+            scribus.selectObject(name)
+            log.info("first selected frametext object is: %s", name)
+            return name
+    # add a Scribus dialog to inform fail
+    log.warning("no frametext object in document!")
+    return None
+
+# Reset the variables of the previous run
+#    (several documents in the same Scribus session, see typoBatch.py)
+def reset_run():
+    global index, runtime, runseconds, skippedstories, processedstories, cachedstories, changedstories, scribus
+    index = None
+    story_heads.clear()
+    frameprofile.clear()
+    runtime = 0
+    runseconds = 0.0
+    skippedstories = 0
+    processedstories = 0
+    cachedstories = 0
+    changedstories = 0
+    # profiling is turned on again by main() if asked for this run
+    typoEngine.profiling = False
+    typoEngine.bridgecalls = None
+    if isinstance(scribus, BridgeCalls):
+        scribus = scribus.module
 
 def main(argv):
     """
     """
-    global page, c, textlenshift, totalpagemove, runtime
+    global textlenshift, runtime, skippedstories, changedstories, scribus
     # setup the script
     #
-    welcome_banner()
-    setup_script()
+    reset_run()
+    if headless:
+        headless_setup()
+    else:
+        welcome_banner()
+        setup_script()
+    typoEngine.set_language(language)
+    typoEngine.set_memo(memosize)
+    typoEngine.memo.reset()
+    typoEngine.reset_stats()
+    load_cache()
+    if profiling:
+        if not isinstance(scribus, BridgeCalls):
+            scribus = BridgeCalls(scribus)
+        typoEngine.profiling = True
+        typoEngine.bridgecalls = lambda: scribus.calls
+        frameprofile.clear()
     # run on frametext only
     #
     start = datetime.now() # get init time start process
-    if workflow == "frametext":
-        text = scribus.getSelectedObject()
-        textlen = scribus.getTextLength(text)
-        scribus.progressTotal(textlen - 1) # max progression bar
-        scribus.messagebarText("Working on frametext...")
-        # analyse of the text char by char
+    with batch_edit():
+        if workflow == "frametext":
+            # no document index: only the selected stories are read
+            stories = selected_stories()
+            lengths = {text: scribus.getTextLength(text) for text in stories}
+            progress = Progress(sum(lengths.values()), "Working on frametext")
+            for text in stories:
+                if textrange:
+                    contents, corrected = process_range(text, lengths[text], *textrange)
+                elif profiling:
+                    contents, corrected = profile_story(text, step=progress.step)
+                else:
+                    contents, corrected = process_story(text, step=progress.step)
+                progress.story_done(len(contents))
+                if corrected != contents:
+                    changedstories += 1
+        # run on all the pages
         #
-        while c <= (textlen - 1):
-            scribus.messagebarText("Working on text...")
-            scribus.progressSet(c)   # progression bar step
-            # setup prevchar, char and nextchar
-            define_char(c, textlen, text)
-            #print("DEBUG mode", "  Text=", text, "c=", c, "/", textlen, "  char=", char)
-            # adjust typo
-            for dotypo in FR_typo_todo:
-                if (dotypo[0](char)):
-                    dotypo[1](c, text, prevchar, nextchar)
-            # next character
-            c += 1
-    # run on all the pages
-    #
-    if workflow == "page":
-        pagenum = scribus.pageCount()  # page number   
-        scribus.progressTotal(pagenum) # max progression bar
-        scribus.messagebarText("Working on document...")
+        if workflow == "page":
+            index = document_index()
+            stories = index_stories(index)
+            textframes = [name for name, frame in index.items() if frame["type"] == 4]
+            # a story of linked frames is processed only once, from its first frame
+            skippedstories = len(textframes) - len(stories)
+            lengths = {frame["head"]: frame["textlen"] for frame in index.values() if frame["type"] == 4}
+            progress = Progress(sum(lengths.values()), "Working on document")
+            #
+            for text in stories:
+                frame = index[story_frames(index, text)[0]] # first frame of the story on a page
+                progress.label = """Working on page {number}""".format(number=frame["page"])
+                if profiling:
+                    contents, corrected = profile_story(text, step=progress.step)
+                else:
+                    contents, corrected = process_story(text, step=progress.step)
+                progress.story_done(len(contents))
+                if corrected != contents:
+                    changedstories += 1
+                if log.isEnabledFor(logging.DEBUG):
+                    print_debug(0, frame["page"], pagenum, story_frames(index, text), text,
+                                frame["textlen"], len(contents), textlenshift,
+                                typoEngine.default_state.totalpagemove, contents)
+                    rebuild_text(corrected)
+                update_index(index, text, len(corrected))
+        # check all the stories without any change
         #
-        while (page <= pagenum):
-            scribus.progressSet(page)  # progression bar step
-            message_info = """Working on page {number}""".format(number=page)
-            info(message_info)
-            scribus.gotoPage(page)
-            list_item = scribus.getPageItems() # [('Text1', 4, 0), ('Image1', 2, 1), ...]
-            for item in list_item:
-                # must work only on the text
-                if (item[1] == 4):  # 4 (= Text frame) of ('Text1', 4, 0)
-                    text = item[0]  # Text1 of ('Text1', 4, 0)
-                    # select all the text in current frame for couting characters
-                    # use selectFrameText instead of getTextLength
-                    # bug : getTextLength sends all the text from ALL the linked frames
-                    #       if an object has not been selected!
-                    #       textlen = scribus.getTextLength(text)
-                    scribus.selectFrameText(0,-1,text)
-                    contents = scribus.getFrameText(text)
-                    textlen2 = len(contents)              # real text length to work
-                    textlen = scribus.getTextLength(text) # whole text length over all the linked frames
-                    c = 0 # init cursor at position 0
-                    print_debug(c, page, pagenum, list_item, text,
-                                textlen, textlen2, textlenshift, totalpagemove,
-                                contents)
-                    # analyse of the text char by char
-                    current_text = ''
-                    while c <= (textlen - 1):
-                        # setup prevchar, char and nextchar
-                        define_char(c, textlen, text)
-                        #print("DEBUG mode", "  Text=", text, "c=", c, "/", textlen, "  char=", char)
-                        # here, the job to do on characters...
-                        current_text += char
-                        # adjust typo
-                        for dotypo in FR_typo_todo:
-                            if (dotypo[0](char)):
-                                dotypo[1](c, text, prevchar, nextchar)
-                        # next character
-                        c += 1
-                    rebuild_text(current_text)
-            # nextpage
-            page += 1
+        if workflow == "lint":
+            index = document_index()
+            stories = index_stories(index)
+            lengths = {frame["head"]: frame["textlen"] for frame in index.values() if frame["type"] == 4}
+            progress = Progress(sum(lengths.values()), "Checking document")
+            report = []
+            for text in stories:
+                scribus.selectText(0, 0, text) # no text selection: getAllText returns all the story
+                contents = scribus.getAllText(text)
+                for violation in typoEngine.lint_text(contents):
+                    report.append(dict(frame=text, **violation))
+                progress.story_done(len(contents))
+    if workflow == "lint":
+        lint_report(report)   # the document is redrawn behind the dialog
+        return 1 if report else 0
+    save_cache()
+    if profiling:
+        log.info("profile: %s", write_profile())
     # get end time process
     end = datetime.now()
     runtime = process_time(end, start)
+    if savedoc:
+        scribus.saveDoc()
     # Final stats information
     #    
-    final_stats()       
+    if headless:
+        headless_stats()
+    else:
+        final_stats()
+    return 0
 
 def main_wrapper(argv):
     """The main_wrapper() function disables redrawing, sets a sensible generic
     status bar message, and optionally sets up the progress bar. It then runs
     the main() function. Once everything finishes it cleans up after the main()
-    function, making sure everything is sane before the script terminates."""
+    function, making sure everything is sane before the script terminates.
+    It returns the exit status of the run (see parse_options)."""
+    listener = None
     try:
+        parse_options(argv)
+        listener = setup_log()
         scribus.statusMessage("Running script...")
         scribus.progressReset()
-        main(argv)
+        return main(argv)
+    except SystemExit as error: # end of the script (cancel, bad selection...)
+        return error.code if isinstance(error.code, int) else 1 if error.code else 0
     finally:
+        if listener:
+            listener.stop() # write the last messages of the log file
+            for handler in listener.handlers:
+                handler.close()
         # Exit neatly even if the script terminated with an exception,
         # so we leave the progress bar and status bar blank and make sure
         # drawing is enabled.
@@ -768,4 +1104,17 @@ def main_wrapper(argv):
 # It only runs main() if being run as a script. This permits you to import your script
 # and control it manually for debugging.
 if __name__ == '__main__':
-    main_wrapper(sys.argv)
+    try:
+        status = main_wrapper(sys.argv)
+    except Exception:
+        if not headless:
+            raise
+        log.exception("typography failed")
+        status = 3
+    if commandline:
+        # Scribus does not give the status of sys.exit() to the shell, and
+        # would ask for saving the document: leave at once
+        logging.shutdown()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
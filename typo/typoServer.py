@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+ (C)2023 Patrice Karatchentzeff
+
+ This program is free software; you can redistribute it and/or modify
+ it under the terms of the  GPL, v3 (GNU General Public License as published by
+ the Free Software Foundation, version 3 of the License), or any later version.
+ See the Scribus Copyright page in the Help Browser for further informaton
+ about GPL, v3.
+
+ SYNOPSIS
+
+ Typography service: the rules of typoEngine.py served over HTTP (JSON), on
+a local TCP port or on a Unix socket, by a long-lived process. A web CMS can
+correct its paragraphs before they ever reach Scribus.
+
+ REQUIREMENTS
+
+ Nothing but Python (asyncio): no Scribus, no web framework.
+
+ USAGE
+
+    python3 typoServer.py [--host 127.0.0.1] [--port 8765] [--unix PATH] [--workers N] [--memo N]
+
+    curl -s localhost:8765/typo -d '{"paragraphs": ["Bonjour ,le monde:"]}'
+
+ POST /typo with a JSON object:
+    paragraphs: list of strings to correct (a batch)
+    language: rule pack (default: the --language of the service)
+    edits: true to also get the list of changes of each paragraph
+ answers a JSON object:
+    paragraphs: the corrected strings, in the same order
+    edits: (with edits) the [start, end, replacement] of each paragraph
+    stats: the indicators of the batch (see typoEngine.stats)
+    language, version: the rule pack used and its rules_version()
+
+ GET /health answers the rule packs and their version.
+
+ An error answers {"error": message} with the HTTP status 400 (bad
+request), 404, 405, 413 (batch too large), 500 (failure of the service) or
+503 (batch too slow).
+
+ DEVELOPMENT
+
+The rule packs are compiled once at the start of the service, so no request
+pays for it. Each batch is corrected with its own TypoState in a pool of
+threads: the event loop keeps on reading the other requests. At most
+--workers batches are corrected at the same time, the other ones wait for
+their turn; a batch has at most --max-chars characters, and a request not
+answered in --timeout seconds (its wait for a worker included) gets a 503.
+A thread cannot be stopped: a batch given up keeps its worker until it is
+done, so the requests behind it wait, or time out, instead of piling up
+more work. The paragraphs
+already corrected by a request are found in the memo of the engine.
+
+"""
+
+import sys
+import argparse
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import typoEngine
+
+# variables definition
+#
+host = "127.0.0.1"    # address of the service (local only by default)
+port = 8765           # TCP port of the service
+workers = 4           # max number of batches corrected at the same time
+maxchars = 1 << 22    # max number of characters of a batch (4M)
+timeout = 30.0        # max duration of a batch, in seconds
+maxheader = 16384     # max size of the request line and headers
+memosize = 65536      # paragraphs kept in the memo, shared by all the requests (see typoEngine.ParagraphMemo)
+log = logging.getLogger("typoServer")
+
+# HTTP status
+#
+reasons = {200: "OK",
+           400: "Bad Request",
+           404: "Not Found",
+           405: "Method Not Allowed",
+           413: "Payload Too Large",
+           500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+# Compile all the rule packs
+#    returns {language: version}
+def warm_up():
+    versions = {}
+    for name in typoEngine.rule_packs:
+        typoEngine.load_pack(name)
+        versions[name] = typoEngine.rules_version(typoEngine.pack_spacing(name))
+    return versions
+
+# Correct a batch of paragraphs (in a worker thread)
+#    returns the answer of the request
+def typo_batch(paragraphs, language, edits=False):
+    state = typoEngine.TypoState()
+    corrected = [typoEngine.correct_text(paragraph, language, state) for paragraph in paragraphs]
+    answer = {"paragraphs": corrected,
+              "stats": state.stats(),
+              "language": language,
+              "version": typoEngine.rules_version(typoEngine.pack_spacing(language))}
+    if edits:
+        answer["edits"] = [typoEngine.edit_script(old, new) for old, new in zip(paragraphs, corrected)]
+    return answer
+
+# Check the JSON object of a POST /typo
+#    returns (paragraphs, language, edits)
+def parse_batch(body):
+    try:
+        request = json.loads(body.decode("utf-8"))
+    except ValueError as error:
+        raise RequestError(400, "invalid JSON: " + str(error))
+    if not isinstance(request, dict):
+        raise RequestError(400, "a JSON object is expected")
+    paragraphs = request.get("paragraphs")
+    if not isinstance(paragraphs, list) or not all(isinstance(p, str) for p in paragraphs):
+        raise RequestError(400, "paragraphs must be a list of strings")
+    if sum(len(p) for p in paragraphs) > maxchars:
+        raise RequestError(413, "more than {maxchars} characters".format(maxchars=maxchars))
+    language = request.get("language") or typoEngine.language
+    if not isinstance(language, str):
+        raise RequestError(400, "language must be a string")
+    language = typoEngine.find_pack(language)
+    if language is None:
+        raise RequestError(400, "no rule pack for language " + repr(request.get("language")))
+    return paragraphs, language, bool(request.get("edits"))
+
+class TypoService:
+    def __init__(self, workers=workers):
+        self.versions = warm_up()
+        self.executor = ThreadPoolExecutor(workers)
+        self.slots = asyncio.Semaphore(workers)
+        self.requests = 0
+
+    # Answer of a request
+    #    returns (status, JSON object)
+    async def dispatch(self, method, path, body):
+        path = path.split("?", 1)[0]
+        if path == "/health":
+            if method != "GET":
+                raise RequestError(405, "GET only")
+            return 200, {"packs": self.versions, "language": typoEngine.language,
+                         "requests": self.requests, "memo": typoEngine.memo.stats()}
+        if path != "/typo":
+            raise RequestError(404, "unknown path " + path)
+        if method != "POST":
+            raise RequestError(405, "POST only")
+        paragraphs, language, edits = parse_batch(body)
+        try:
+            # the wait for a worker is part of the timeout
+            answer = await asyncio.wait_for(self.correct(paragraphs, language, edits), timeout)
+        except asyncio.TimeoutError:
+            raise RequestError(503, "batch not done in {timeout} s".format(timeout=timeout))
+        self.requests += 1
+        return 200, answer
+
+    # Correct a batch in a worker thread
+    #    a thread cannot be stopped: the slot of a batch given up (timeout)
+    #    is only released when its thread is really done, so the next
+    #    batches wait for a free worker instead of piling up behind it
+    async def correct(self, paragraphs, language, edits):
+        loop = asyncio.get_running_loop()
+        await self.slots.acquire()
+        try:
+            job = self.executor.submit(typo_batch, paragraphs, language, edits)
+        except BaseException:
+            self.slots.release()
+            raise
+        job.add_done_callback(lambda job: self.release(loop))
+        return await asyncio.wrap_future(job)
+
+    def release(self, loop):
+        try:
+            loop.call_soon_threadsafe(self.slots.release)
+        except RuntimeError: # the service is closed
+            pass
+
+    # One connection: HTTP/1.1 requests until the client closes it
+    #
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.answer(writer, 413, {"error": "headers too large"}, False)
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, path, version = lines[0].split(" ")
+                except ValueError:
+                    await self.answer(writer, 400, {"error": "bad request line"}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                keepalive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    length = int(headers.get("content-length", 0))
+                    if length > 4 * maxchars + maxheader:  # UTF-8: at most 4 bytes by character
+                        raise RequestError(413, "request too large")
+                    body = await reader.readexactly(length) if length > 0 else b""
+                    status, answer = await self.dispatch(method, path, body)
+                except RequestError as error:
+                    status, answer = error.status, {"error": str(error)}
+                    keepalive = keepalive and status != 413
+                except ValueError:
+                    status, answer = 400, {"error": "bad Content-Length"}
+                    keepalive = False
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as error: # a bug: the client still gets an answer
+                    log.exception("%s %s failed", method, path)
+                    status, answer = 500, {"error": "internal error: " + repr(error)}
+                    keepalive = False
+                await self.answer(writer, status, answer, keepalive)
+                if not keepalive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def answer(self, writer, status, answer, keepalive):
+        body = json.dumps(answer, ensure_ascii=False).encode("utf-8")
+        writer.write("HTTP/1.1 {status} {reason}\r\n"
+                     "Content-Type: application/json; charset=utf-8\r\n"
+                     "Content-Length: {length}\r\n"
+                     "Connection: {connection}\r\n\r\n".format(
+                         status=status, reason=reasons[status], length=len(body),
+                         connection="keep-alive" if keepalive else "close").encode("latin-1"))
+        writer.write(body)
+        await writer.drain()
+
+    # Start listening
+    #    unix: path of a Unix socket, instead of host and port
+    async def start(self, host=host, port=port, unix=None):
+        limit = maxheader
+        if unix:
+            return await asyncio.start_unix_server(self.handle, unix, limit=limit)
+        return await asyncio.start_server(self.handle, host, port, limit=limit)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+# Client of the service (tests, scripts)
+#    returns the answer of POST /typo
+async def request(paragraphs, language=None, edits=False, host=host, port=port, unix=None):
+    if unix:
+        reader, writer = await asyncio.open_unix_connection(unix)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        query = {"paragraphs": paragraphs, "edits": edits}
+        if language:
+            query["language"] = language
+        body = json.dumps(query, ensure_ascii=False).encode("utf-8")
+        writer.write("POST /typo HTTP/1.1\r\nHost: {host}\r\n"
+                     "Content-Type: application/json\r\nContent-Length: {length}\r\n"
+                     "Connection: close\r\n\r\n".format(host=host, length=len(body)).encode("latin-1"))
+        writer.write(body)
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        answer = json.loads((await reader.read()).decode("utf-8"))
+        status = int(head.split(b" ", 2)[1])
+        if status != 200:
+            raise RequestError(status, answer.get("error", ""))
+        return answer
+    finally:
+        writer.close()
+
+async def serve(args):
+    service = TypoService(args.workers)
+    server = await service.start(args.host, args.port, args.unix)
+    print("typoServer listening on {where}".format(
+        where=args.unix or "http://{host}:{port}".format(host=args.host, port=args.port)),
+          file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+def main(argv):
+    global maxchars, timeout
+    parser = argparse.ArgumentParser(description="Typography service of the Imprimerie nationale rules")
+    parser.add_argument("--host", default=host, help="address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=port, help="TCP port (default: %(default)s)")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of a TCP port")
+    parser.add_argument("--workers", type=int, default=workers,
+                        help="batches corrected at the same time (default: %(default)s)")
+    parser.add_argument("--max-chars", type=int, default=maxchars,
+                        help="max characters of a batch (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=timeout,
+                        help="max duration of a batch, in seconds (default: %(default)s)")
+    parser.add_argument("--language", default=typoEngine.language,
+                        help="default rule pack: " + ", ".join(typoEngine.rule_packs) + " (default: %(default)s)")
+    parser.add_argument("--memo", type=int, default=memosize,
+                        help="paragraphs kept in the memo, 0 for none (default: %(default)s)")
+    parser.add_argument("--backend", choices=("regex", "loop"), default=typoEngine.backend,
+                        help="algorithm (default: %(default)s)")
+    args = parser.parse_args(argv[1:])
+    maxchars = args.max_chars
+    timeout = args.timeout
+    typoEngine.set_backend(args.backend)
+    typoEngine.set_memo(args.memo)
+    try:
+        typoEngine.set_language(args.language)
+    except ValueError as error:
+        parser.error(str(error))
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,503 @@
+# -*- coding: utf-8 -*-
+"""
+ (C)2023 Patrice Karatchentzeff
+
+ This program is free software; you can redistribute it and/or modify
+ it under the terms of the  GPL, v3 (GNU General Public License as published by
+ the Free Software Foundation, version 3 of the License), or any later version.
+ See the Scribus Copyright page in the Help Browser for further informaton
+ about GPL, v3.
+
+ SYNOPSIS
+
+ Offline version of typoImprimerieNationale.py: the French typography of
+the Imprimerie nationale (France) is applied directly on Scribus documents
+(.sla or .sla.gz files), without any Scribus process.
+
+ REQUIREMENTS
+
+ Nothing but Python: the .sla XML is read and written with the standard
+library, the typography is done by typoEngine.py.
+
+ USAGE
+
+    python3 typoSla.py [-o OUTPUT_DIRECTORY] [--masters] [--jobs N] [--language fr-FR|auto] [--memo N] path [path ...]
+    python3 typoSla.py --check [--report REPORT] [--masters] [--jobs N] path [path ...]
+
+ A path is a Scribus document or a directory (all the .sla and .sla.gz
+files inside, recursively). Without -o, the documents are modified in
+place. Documents without any change are not written. With --jobs N, the
+documents (or the stories of a single document) are processed by N worker
+processes; the result is the same as with a single process. With
+--language auto, each part of a story is corrected with the rule pack of its
+language in Scribus, and a part in a language without pack is kept as is.
+
+ With --check, no document is written: the changes to do are only listed
+(document, frame, offset, rule, text before and after) in REPORT (.json or
+.csv, default: JSON on the standard output). The exit status is 1 if any
+change is to do, so it can be used as a pre-flight check.
+
+ DEVELOPMENT
+
+In a .sla file, the text of a story is stored in the StoryText element of
+the first frametext of the chain: a sequence of ITEXT elements (runs of
+characters with the same character style, the text is in the CH attribute)
+and of special characters elements (para, tab, nbspace...). Each story is
+flattened to a string for the engine, then rebuilt: the unchanged
+characters keep their element, a new character takes the character style
+of the character it replaces, or of its neighbour.
+
+"""
+
+import sys
+import os
+import gzip
+import argparse
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import xml.etree.ElementTree as ET
+
+import typoEngine
+
+# variables definition
+#
+masters = False       # also process the stories of the master pages
+check = False         # only report the changes to do, never write the documents
+language = "fr-FR"    # rule pack (see typoEngine.rule_packs), auto: the language of the text
+memosize = 4096       # paragraphs kept in the memo of each process (see typoEngine.ParagraphMemo)
+
+# Special characters elements of a StoryText and their characters
+# (the same as the Scribus API returns with getAllText)
+#   para is the paragraph separator and has a paragraph style,
+#   the other ones have a character style like ITEXT
+#
+special_chars = {"para": "\r",
+                 "tab": "\t",
+                 "breakline": "\x1c",
+                 "breakcol": "\x1a",
+                 "breakframe": "\x1b",
+                 "nbspace": typoEngine.non_breaking_space,
+                 "nbhyphen": "\u2011",
+                 "zwnbspace": "\u2060",
+                 "zwspace": "\u200b"}
+# A new character with an element is written as this element: a new
+# non breaking space is a <nbspace/>, as Scribus saves the U+00A0 which the
+# Scribus script inserts with insertText(), so both give the same file
+special_tags = {char: tag for tag, char in special_chars.items()}
+
+# Elements of a StoryText which are not characters
+#
+layout_tags = ("DefaultStyle", "trail")
+
+# Any other element (marks, variables, inline objects...) is kept as is,
+# as a character which is not a space
+object_char = "\ufffc"
+
+# Story flattening
+#
+# Flatten a StoryText element
+#    returns (chars, owners, layouts)
+#      chars: the text of the story as a list of characters
+#      owners: for each character, the element it comes from
+#      layouts: position -> list of non character elements before it
+def flatten_story(story):
+    chars = []
+    owners = []
+    layouts = {}
+    for element in story:
+        if element.tag == "ITEXT":
+            for char in element.get("CH", ""):
+                chars.append(char)
+                owners.append(element)
+        elif element.tag in layout_tags:
+            layouts.setdefault(len(chars), []).append(element)
+        else:
+            chars.append(special_chars.get(element.tag, object_char))
+            owners.append(element)
+    return chars, owners, layouts
+
+# Element giving the character style of a character
+#    ITEXT and special characters (except para) have a character style
+def has_char_style(element):
+    return element is not None and element.tag != "para" \
+        and (element.tag == "ITEXT" or element.tag in special_chars)
+
+# Character style attributes of an element (all but the text)
+#
+def char_style(element):
+    attrib = dict(element.attrib)
+    attrib.pop("CH", None)
+    return attrib
+
+# Character style of a new character from its neighbours
+#    styles: the styles already found for the previous items
+def neighbour_style(items, styles, index):
+    for neighbour in range(index - 1, -1, -1):
+        if items[neighbour][0]:
+            if has_char_style(styles[neighbour]):
+                return styles[neighbour]
+            break
+    for neighbour in range(index + 1, len(items)):
+        char, element, kept = items[neighbour]
+        if char and has_char_style(element):
+            return element
+    return None
+
+# Rebuild a StoryText element after the edits
+#    edits: the edit script of the engine on the flattened text
+#
+def rebuild_story(story, chars, owners, layouts, edits):
+    # new sequence of (char, element, kept)
+    #   kept: True if the character is unchanged (element is its own element),
+    #         False if it is a new one (element is a style hint or None)
+    items = []
+    def copy(first, last):
+        for position in range(first, last):
+            items.extend(('', layout, True) for layout in layouts.get(position, ()))
+            items.append((chars[position], owners[position], True))
+    position = 0
+    for start, end, replacement in edits:
+        copy(position, start)
+        for removed in range(start, end):
+            items.extend(('', layout, True) for layout in layouts.get(removed, ()))
+        for k, char in enumerate(replacement):
+            hint = owners[start + k] if start + k < end else None
+            items.append((char, hint, False))
+        position = end
+    copy(position, len(chars))
+    items.extend(('', layout, True) for layout in layouts.get(len(chars), ()))
+    # character style of the new characters: the replaced character,
+    # else the previous character (if not a para), else the next one
+    styles = []
+    for index, (char, element, kept) in enumerate(items):
+        if kept or has_char_style(element):
+            styles.append(element)
+        else:
+            styles.append(neighbour_style(items, styles, index))
+    # new children: runs of characters with the same style become ITEXT
+    children = []
+    run = []
+    run_style = None
+    def close_run():
+        if run:
+            if run_style is None:
+                attrib = {}
+            elif run_style.tag == "ITEXT":
+                attrib = dict(run_style.attrib) # keep the order of the attributes
+            else:
+                attrib = char_style(run_style)
+            attrib["CH"] = ''.join(run)
+            children.append(ET.Element("ITEXT", attrib))
+            del run[:]
+    for (char, element, kept), style in zip(items, styles):
+        if kept and element.tag != "ITEXT":
+            close_run()
+            children.append(element)
+        elif not kept and char in special_tags:
+            close_run()
+            attrib = char_style(style) if style is not None else {}
+            children.append(ET.Element(special_tags[char], attrib))
+        else:
+            if run and style is not run_style:
+                close_run()
+            run_style = style
+            run.append(char)
+    close_run()
+    # keep the indentation of the file
+    tail = story[0].tail if len(story) else None
+    last_tail = story[-1].tail if len(story) else None
+    story[:] = children
+    for child in children:
+        child.tail = tail
+    if children:
+        children[-1].tail = last_tail
+
+# Languages of a story (--language auto)
+#
+# The language of a character is the first one found in: its element
+# (LANGUAGE attribute) and its character style (CPARENT), the style of its
+# paragraph (the para element at its end, or the trail element for the
+# last paragraph), the default style of the story, the document.
+#
+
+# Character styles and paragraph styles of a document, by name
+#
+def document_styles(root):
+    charstyles = {style.get("CNAME"): style for style in root.iter("CHARSTYLE")}
+    parastyles = {style.get("NAME"): style for style in root.iter("STYLE")}
+    return charstyles, parastyles
+
+# Default language of a document
+#
+def document_language(root):
+    document = root.find("DOCUMENT")
+    if document is not None and document.get("LANGUAGE"):
+        return document.get("LANGUAGE")
+    for style in root.iter("CHARSTYLE"):
+        if style.get("DefaultStyle") == "1" and style.get("LANGUAGE"):
+            return style.get("LANGUAGE")
+    return None
+
+# Language of an element or of its styles (None if not set)
+#
+def style_language(element, styles, seen=()):
+    if element is None or id(element) in seen:  # no loop on a broken file
+        return None
+    if element.get("LANGUAGE"):
+        return element.get("LANGUAGE")
+    charstyles, parastyles = styles
+    seen = seen + (id(element),)
+    return style_language(charstyles.get(element.get("CPARENT")), styles, seen) \
+        or style_language(parastyles.get(element.get("PARENT")), styles, seen)
+
+# Language runs of a flattened story
+#    returns a list of (start, end, language) covering the text
+def story_languages(chars, owners, layouts, styles, default=None):
+    storystyle = None
+    paragraph = None
+    for element in layouts.get(0, ()):
+        if element.tag == "DefaultStyle":
+            storystyle = element
+    for element in layouts.get(len(chars), ()):
+        if element.tag == "trail":
+            paragraph = element
+    storylanguage = style_language(storystyle, styles) or default
+    # paragraph of each character, from the end of the story
+    paragraphs = [None] * len(chars)
+    for position in range(len(chars) - 1, -1, -1):
+        if owners[position].tag == "para":
+            paragraph = owners[position]
+        paragraphs[position] = paragraph
+    runs = []
+    languages = {}  # (element, paragraph) -> language
+    for position, (owner, paragraph) in enumerate(zip(owners, paragraphs)):
+        key = (id(owner), id(paragraph))
+        if key not in languages:
+            languages[key] = style_language(owner, styles) \
+                or style_language(paragraph, styles) or storylanguage
+        name = languages[key]
+        if runs and runs[-1][2] == name:
+            runs[-1][1] = position + 1
+        else:
+            runs.append([position, position + 1, name])
+    return [tuple(run) for run in runs]
+
+# Stories of a document
+#    only the frametexts of the pages (as the Scribus script), and of the
+#    master pages if masters is True
+#    yields (frame name, StoryText element)
+#
+def document_stories(root):
+    tags = ["PAGEOBJECT"]
+    if masters:
+        tags.append("MASTEROBJECT")
+    for document in root.iter("DOCUMENT"):
+        for item in document:
+            if item.tag in tags:
+                yield from item_stories(item)
+
+# Items which may be in a group (a PAGEOBJECT of PTYPE 12)
+#
+item_tags = ("PAGEOBJECT", "MASTEROBJECT", "FRAMEOBJECT")
+
+# Stories of an item, with the name of the innermost item holding each one
+#    a group holds its items; a table holds the stories of its cells
+def item_stories(item, name=None):
+    if name is None:
+        name = item.get("ANNAME") or item.get("ItemID", "")
+    for child in item:
+        if child.tag in item_tags:
+            yield from item_stories(child)
+        elif child.tag == "StoryText":
+            yield name, child
+        else:
+            yield from item_stories(child, name)
+
+# Correct the text of a story (in a worker process when running in parallel)
+#    returns (corrected text, indicators)
+#    language is given again for the worker processes
+#    the stories already corrected are taken from the memo (see --memo)
+#    runs: the languages of the story (see story_languages) for --language auto
+def typo_contents(contents, language="fr-FR", runs=None):
+    state = typoEngine.TypoState()
+    if runs is not None:
+        corrected = typoEngine.correct_segments(contents, runs, state)
+    else:
+        corrected = typoEngine.correct_text(contents, language, state)
+    return corrected, state.stats()
+
+# Add the indicators of a story or a document to a total
+#
+def merge_stats(total, indicators):
+    for indicator, value in indicators.items():
+        total[indicator] = total.get(indicator, 0) + value
+    return total
+
+# Read and write a document (.sla or .sla.gz)
+#
+def open_document(path, mode, compressed=None):
+    if compressed is None:
+        compressed = path.endswith(".gz")
+    if compressed:
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+def read_document(path):
+    with open_document(path, "rb") as f:
+        return ET.parse(f)
+
+def write_document(tree, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = path + ".tmp"
+    with open_document(temporary, "wb", path.endswith(".gz")) as f:
+        tree.write(f, encoding="UTF-8", xml_declaration=True)
+    os.replace(temporary, path) # never leave a half written document
+
+# Apply the typography on one document
+#    executor: optional process pool for correcting the stories in parallel
+#    returns (number of stories, number of edits, indicators, report)
+#      report: the changes to do, only in check mode (the document is not written)
+#  The indicators are added in the order of the stories, so the result is
+#  the same with or without executor.
+#
+def typo_document(source, target, executor=None, jobs=1):
+    tree = read_document(source)
+    frames = []
+    stories = []
+    for frame, story in document_stories(tree.getroot()):
+        frames.append(frame)
+        stories.append((story,) + flatten_story(story))
+    texts = [''.join(chars) for story, chars, owners, layouts in stories]
+    if language == "auto":
+        styles = document_styles(tree.getroot())
+        default = document_language(tree.getroot())
+        runs = [story_languages(chars, owners, layouts, styles, default)
+                for story, chars, owners, layouts in stories]
+    else:
+        runs = repeat(None)
+    if executor is None:
+        results = map(typo_contents, texts, repeat(language), runs)
+    else:
+        results = executor.map(typo_contents, texts, repeat(language), runs,
+                               chunksize=max(1, len(texts) // (4 * jobs)))
+    total = dict.fromkeys(typoEngine.indicators, 0)
+    edits = 0
+    report = []
+    for frame, (story, chars, owners, layouts), contents, (corrected, indicators) \
+            in zip(frames, stories, texts, results):
+        merge_stats(total, indicators)
+        if check:
+            for violation in typoEngine.violations(contents, corrected):
+                report.append(dict(document=source, frame=frame, **violation))
+            continue
+        # no API cost here: do not rewrite the unchanged signs
+        script = typoEngine.edit_script(contents, corrected, gap=0)
+        if script:
+            rebuild_story(story, chars, owners, layouts, script)
+        edits += len(script)
+    if check:
+        return len(stories), len(report), total, report
+    if edits or source != target:
+        write_document(tree, target)
+    return len(stories), edits, total, report
+
+# One document job
+#    job: (source, target, masters, check, language, memosize), the options are given
+#    again for the worker processes
+#    returns (source, number of stories, number of edits, indicators, report)
+#
+def typo_document_job(job, executor=None, jobs=1):
+    global masters, check, language, memosize
+    source, target, masters, check, language, memosize = job
+    typoEngine.set_memo(memosize)
+    if language != "auto":
+        typoEngine.set_language(language)
+    return (source,) + typo_document(source, target, executor, jobs)
+
+# Run all the documents, in order
+#    jobs: number of worker processes
+#      - several documents: one document by worker
+#      - a single document: its stories are shared between the workers
+#    yields the result of typo_document_job for each document
+#
+def run_documents(documents, jobs=1):
+    todo = ((source, target, masters, check, language, memosize) for source, target in documents)
+    if jobs <= 1:
+        for job in todo:
+            yield typo_document_job(job)
+        return
+    todo = list(todo)
+    with ProcessPoolExecutor(jobs) as executor:
+        if len(todo) > 1:
+            yield from executor.map(typo_document_job, todo)
+        else:
+            for job in todo:
+                yield typo_document_job(job, executor, jobs)
+
+# Documents of a list of paths (files or directories), one at a time
+#    yields (source, target)
+#
+def iter_documents(paths, output=None):
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, files in os.walk(path):
+                subdirectories.sort()
+                for name in sorted(files):
+                    if name.endswith(".sla") or name.endswith(".sla.gz"):
+                        source = os.path.join(directory, name)
+                        relative = os.path.relpath(source, path)
+                        yield source, os.path.join(output, relative) if output else source
+        else:
+            yield path, os.path.join(output, os.path.basename(path)) if output else path
+
+def main(argv):
+    global masters, check, language, memosize
+    parser = argparse.ArgumentParser(description="French typography of the Imprimerie nationale on Scribus documents")
+    parser.add_argument("paths", nargs="+", help="Scribus documents or directories")
+    parser.add_argument("-o", "--output", help="output directory (default: modify the documents in place)")
+    parser.add_argument("--masters", action="store_true", help="also process the master pages")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes (default: %(default)s)")
+    parser.add_argument("--language", default=language,
+                        help="rule pack: " + ", ".join(typoEngine.rule_packs)
+                        + ", or auto for the language of the text (default: %(default)s)")
+    parser.add_argument("--memo", type=int, default=memosize,
+                        help="paragraphs kept in the memo of the corrected paragraphs, 0 for none (default: %(default)s)")
+    parser.add_argument("--check", action="store_true",
+                        help="do not modify the documents, only report the changes to do")
+    parser.add_argument("--report", help="report file of --check, .json or .csv (default: JSON on stdout)")
+    args = parser.parse_args(argv[1:])
+    masters = args.masters
+    check = args.check
+    memosize = args.memo
+    language = "auto" if args.language == "auto" else typoEngine.find_pack(args.language)
+    if language is None:
+        parser.error("no rule pack for language " + repr(args.language))
+    # in check mode without report file, stdout is the report: the summary goes to stderr
+    out = sys.stderr if check and not args.report else sys.stdout
+    total = dict.fromkeys(typoEngine.indicators, 0)
+    documents = 0
+    report = []
+    for source, stories, edits, indicators, violations in run_documents(iter_documents(args.paths, args.output), args.jobs):
+        documents += 1
+        merge_stats(total, indicators)
+        report.extend(violations)
+        print("{source}: {stories} stories, {edits} changes".format(
+            source=source, stories=stories, edits=edits), file=out)
+    print("{documents} documents".format(documents=documents), file=out)
+    for indicator, value in total.items():
+        print("  {indicator:<18} {value}".format(indicator=indicator, value=value), file=out)
+    if check:
+        if args.report:
+            fmt = "csv" if args.report.endswith(".csv") else "json"
+            with open(args.report, "w", encoding="utf-8", newline="") as f:
+                typoEngine.write_report(report, f, fmt)
+        else:
+            typoEngine.write_report(report, sys.stdout)
+        return 1 if report else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))